@@ -1,8 +1,15 @@
+import asyncio
+import codecs
 import csv
+import multiprocessing
 import re
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache, partial
 from io import StringIO
-from datetime import datetime
-from typing import List, Dict, Tuple
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Callable, Iterable, List, Dict, NamedTuple, Sequence, Set, Tuple
 from tqdm import tqdm
 import logging
 from psycopg2 import sql
@@ -32,6 +39,12 @@ COLUMNS_TO_RENAME = [
     ('news_score_roll_avg_30', True)
 ]
 
+# Способы записи строк во временную таблицу файла: COPY или INSERT на каждую строку
+LOAD_MODES = ('copy', 'insert')
+
+# Типы колонок временной таблицы, остальные колонки - FLOAT, как в основной таблице
+STAGE_TYPES = {'secid': 'TEXT', 'date': 'DATE'}
+
 
 def sanitize_column_name(name: str, columns_to_rename: List[Tuple], need_check: bool = True) -> str:
     """
@@ -86,17 +99,134 @@ def sanitize_column_name(name: str, columns_to_rename: List[Tuple], need_check:
     return name
 
 
+class ColumnPlan(NamedTuple):
+    """
+    План обработки строк файла с данным заголовком.
+
+    Attributes:
+        columns: Очищенные названия колонок в порядке заголовка
+        date_index: Позиция колонки date в строке
+        text: Признак текстовой колонки (secid, date) для каждой колонки, остальные приводятся к float
+        insert_columns: Колонки строк для вставки: columns, с secid в начале, если его нет в файле
+        add_secid: Тикер добавляется первым значением строки, так как колонки secid нет в файле
+    """
+    columns: Tuple[str, ...]
+    date_index: int
+    text: Tuple[bool, ...]
+    insert_columns: Tuple[str, ...]
+    add_secid: bool
+
+
+@lru_cache(maxsize=256)
+def get_column_plan(header: Tuple[str, ...], need_check: bool = True) -> ColumnPlan:
+    """
+    Очищает названия колонок заголовка один раз и возвращает план обработки строк по позициям.
+    План кэшируется по заголовку: файлы тикеров с одинаковым набором колонок используют один план.
+
+    Raises:
+        ValueError: В заголовке нет колонки date
+    """
+    if 'date' not in header:
+        raise ValueError("В заголовке файла отсутствует колонка 'date'")
+
+    columns = tuple(sanitize_column_name(col, COLUMNS_TO_RENAME, need_check=need_check) for col in header)
+    text = tuple(col in ('secid', 'date') for col in columns)
+    add_secid = 'secid' not in columns
+    insert_columns = ('secid',) + columns if add_secid else columns
+    return ColumnPlan(columns, header.index('date'), text, insert_columns, add_secid)
+
+
+def convert_rows(rows: Iterable[List[str]], plan: ColumnPlan, ticker: str, max_date: date | None) -> List[List]:
+    """
+    Приводит строки CSV файла к значениям для вставки в порядке plan.insert_columns.
+    Строки с датой не позже max_date пропускаются, нечисловые значения числовых колонок заменяются на 'test'.
+    """
+    width = len(plan.columns)
+    converted = []
+    for values in rows:
+        if not values:
+            continue
+        # Недостающие значения короткой строки - None
+        if len(values) < width:
+            values += [None] * (width - len(values))
+        try:
+            row_date = datetime.strptime(values[plan.date_index], "%Y-%m-%d").date()
+
+            if max_date is None or row_date > max_date:
+                clean_row = [ticker] if plan.add_secid else []
+                for value, is_text in zip(values, plan.text):
+                    if is_text:
+                        clean_row.append(value)
+                    elif not value:
+                        clean_row.append(None)
+                    else:
+                        try:
+                            clean_row.append(float(value))
+                        except ValueError:
+                            clean_row.append('test')
+
+                converted.append(clean_row)
+        except Exception as e:
+            logger.warning(f"Ошибка при обработке строки: {str(e)}")
+    return converted
+
+
+def convert_csv(text: str, plan: ColumnPlan, ticker: str, max_date: date | None) -> List[List]:
+    """Разбирает часть CSV файла из целых записей и приводит ее строки как convert_rows. Выполняется в процессах parse_workers."""
+    return convert_rows(csv.reader(StringIO(text)), plan, ticker, max_date)
+
+
 class S3ToPostgresETL:
     """
     Класс для выполнения ETL процесса из S3 в PostgreSQL с использованием единой таблицы.
     Все данные хранятся в таблице securities_data с составным ключом (ticker, date).
     """
 
-    def __init__(self, s3_client: S3Client, pg_client: PostgresClient, table_name: str, need_spec_check: bool = True):
+    def __init__(self, s3_client: S3Client, pg_client: PostgresClient, table_name: str, need_spec_check: bool = True,
+                 load_mode: str = 'copy', batch_size: int = 10000, chunk_size: int = 1 << 20,
+                 file_workers: int = 1, db_workers: int = 1, use_manifest: bool = False, parse_workers: int = 0):
+        """
+        Args:
+            s3_client: Клиент для работы с S3
+            pg_client: Клиент для работы с PostgreSQL
+            table_name: Название основной таблицы
+            need_spec_check: Флаг для обработки специальных случаев в названиях колонок
+            load_mode: Способ записи строк во временную таблицу, из которой они переносятся в основную одним
+                запросом INSERT ... SELECT: 'copy' - COPY FROM STDIN, 'insert' - executemany с INSERT на каждую строку
+            batch_size: Число строк файла, записываемых в таблицу одной пачкой
+            chunk_size: Размер части файла, читаемой из S3 за раз, байт
+            file_workers: Число файлов, загружаемых и разбираемых одновременно, каждый - в транзакции своего соединения
+            db_workers: Число потоков-писателей в PostgreSQL. На время process_bucket у pg_client открывается
+                пул из file_workers + db_workers соединений (PostgresClient.connection_pool), писатели
+                не подключаются заново на каждую пачку
+            use_manifest: Пропускать файлы, не изменившиеся с последней успешной загрузки. ETag, размер и время
+                изменения загруженных файлов хранятся в таблице {table_name}_load_manifest, которая создается
+                только при use_manifest=True
+            parse_workers: Число процессов, разбирающих части файлов. 0 - части разбираются в потоке event loop,
+                и разбор всех файлов идет на одном ядре. Пул процессов создается на время process_bucket
+                (около половины секунды на spawn), каждая часть и ее строки передаются между процессами,
+                поэтому режим окупается для больших файлов при file_workers > 1
+        """
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Неизвестный способ загрузки {load_mode}, допустимые: {LOAD_MODES}")
         self.s3_client = s3_client
         self.pg_client = pg_client
         self.main_table = table_name
         self.need_spec_check = need_spec_check
+        self.load_mode = load_mode
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.file_workers = file_workers
+        self.db_workers = db_workers
+        self.use_manifest = use_manifest
+        self.parse_workers = parse_workers
+        self.manifest_table = f"{table_name}_load_manifest"
+
+        # Изменения схемы таблицы (ALTER TABLE) выполняются по одному, известные колонки кэшируются
+        self._ddl_lock = threading.Lock()
+        self._table_columns: Set[str] | None = None
+        self._executor: Executor | None = None
+        self._parse_executor: Executor | None = None
 
         # Инициализация основной таблицы при создании ETL
         self.initialize_main_table()
@@ -109,6 +239,9 @@ class S3ToPostgresETL:
         else:
             logger.info(f"Таблица {self.main_table} уже существует")
 
+        if self.use_manifest:
+            self.create_manifest_table()
+
     def create_main_table(self):
         """Создает основную таблицу для хранения всех данных."""
         table_id = sql.Identifier(self.main_table)
@@ -131,9 +264,47 @@ class S3ToPostgresETL:
         # Кластеризуем таблицу после создания
         self.pg_client.execute(f"CLUSTER {self.main_table} USING {self.main_table}_pkey")
 
-    async def process_bucket(self, bucket_name: str):
+    def create_manifest_table(self):
+        """Создает таблицу с ETag, размером и временем изменения успешно загруженных файлов S3."""
+        query = sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {manifest} (
+            key TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            last_modified TIMESTAMPTZ,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """).format(manifest=sql.Identifier(self.manifest_table))
+
+        self.pg_client.execute(query)
+
+    def get_load_manifest(self) -> Dict[str, Tuple[str, int]]:
+        """
+        Возвращает ETag и размер успешно загруженных файлов по ключу S3.
+        """
+        query = sql.SQL("SELECT key, etag, size FROM {}").format(sql.Identifier(self.manifest_table))
+        return {key: (etag, size) for key, etag, size in self.pg_client.execute(query) or []}
+
+    def record_load(self, obj: Dict):
+        """
+        Записывает в манифест ETag, размер и время изменения успешно загруженного файла.
+        """
+        query = sql.SQL("""
+        INSERT INTO {} (key, etag, size, last_modified, loaded_at) VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (key) DO UPDATE SET etag = EXCLUDED.etag, size = EXCLUDED.size,
+            last_modified = EXCLUDED.last_modified, loaded_at = EXCLUDED.loaded_at
+        """).format(sql.Identifier(self.manifest_table))
+        self.pg_client.execute(query, (obj["Key"], obj["ETag"], obj["Size"], obj.get("LastModified")))
+
+    async def process_bucket(self, bucket_name: str, force: bool = False):
         """
         Обрабатывает все CSV файлы в указанном бакете S3.
+        Одновременно обрабатывается до file_workers файлов, запросы к PostgreSQL выполняются в пуле
+        из db_workers потоков, чтобы не блокировать загрузку и разбор других файлов. Части файлов
+        разбираются в пуле из parse_workers процессов, если он задан.
+
+        Файлы, ETag и размер которых совпадают с записанными в манифесте при последней успешной загрузке,
+        не загружаются. force=True загружает все файлы, например после очистки основной таблицы.
         """
         try:
             logger.info(f"Начало обработки бакета {bucket_name}")
@@ -144,14 +315,46 @@ class S3ToPostgresETL:
                 logger.warning(f"В бакете {bucket_name} не найдено CSV файлов")
                 return
 
+            logger.info(f"Найдено {len(csv_files)} CSV файлов")
+
+            if self.use_manifest and not force:
+                manifest = self.get_load_manifest()
+                csv_files = [obj for obj in csv_files if manifest.get(obj["Key"]) != (obj["ETag"], obj["Size"])]
+                logger.info(f"Изменились с последней загрузки {len(csv_files)} файлов")
+
             logger.info(f"Найдено {len(csv_files)} CSV файлов для обработки")
 
-            for obj in tqdm(csv_files, desc="Обработка CSV файлов"):
+            semaphore = asyncio.Semaphore(self.file_workers)
+            progress = tqdm(total=len(csv_files), desc="Обработка CSV файлов")
+
+            async def process(obj: Dict):
+                async with semaphore:
+                    try:
+                        ticker = obj["Key"].split('_')[0].lower()
+                        await self.process_file(bucket_name, obj["Key"], ticker)
+                        if self.use_manifest:
+                            await self.run_db(self.record_load, obj)
+                    except Exception as e:
+                        logger.error(f"Ошибка при обработке файла {obj['Key']}: {str(e)}")
+                    finally:
+                        progress.update()
+
+            # Колонки таблицы перечитываются в начале каждого запуска
+            self._table_columns = None
+            # spawn: процессы разбора не должны наследовать потоки и открытые соединения
+            parse_executor = ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context('spawn')) \
+                if self.parse_workers else nullcontext()
+            # Соединение каждого файла держит его транзакцию, остальные - для запросов потоков-писателей
+            with ThreadPoolExecutor(self.db_workers, thread_name_prefix='pg-writer') as executor, parse_executor, \
+                    self.pg_client.connection_pool(self.file_workers + self.db_workers):
+                self._executor = executor
+                self._parse_executor = parse_executor if self.parse_workers else None
                 try:
-                    ticker = obj["Key"].split('_')[0].lower()
-                    await self.process_file(bucket_name, obj["Key"], ticker)
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке файла {obj['Key']}: {str(e)}")
+                    await asyncio.gather(*(process(obj) for obj in csv_files))
+                finally:
+                    self._executor = None
+                    self._parse_executor = None
+                    progress.close()
 
         except Exception as e:
             logger.error(f"Ошибка при обработке бакета {bucket_name}: {str(e)}")
@@ -160,82 +363,140 @@ class S3ToPostgresETL:
     async def process_file(self, bucket_name: str, file_key: str, ticker: str):
         """
         Обрабатывает один CSV файл из S3 и загружает данные в основную таблицу.
+        Файл читается потоком: строки разбираются по мере загрузки и записываются пачками по batch_size
+        во временную таблицу, поэтому расход памяти не зависит от размера файла.
+
+        Файл загружается одной транзакцией: строки переносятся в основную таблицу одним запросом после
+        последней пачки, при ошибке транзакция откатывается и в таблице не остается части файла. Иначе
+        следующий запуск пропустил бы строки файла не позже уже загруженной максимальной даты тикера.
         """
         try:
             logger.info(f"Обработка файла {file_key} для тикера {ticker}")
 
-            csv_content = await self.download_csv(bucket_name, file_key)
-            reader = csv.DictReader(StringIO(csv_content))
-
-            if not reader.fieldnames:
+            transaction = self.pg_client.get_cursor()
+            cursor = await self.run_db(transaction.__enter__)
+            try:
+                plan, staged = await self.stage_file(cursor, bucket_name, file_key, ticker)
+                await self.run_db(self.commit_file, transaction, cursor, plan.insert_columns if staged else None)
+            except BaseException as e:
+                # Откат транзакции файла
+                await self.run_db(transaction.__exit__, type(e), e, e.__traceback__)
+                raise
+
+            if plan is None:
                 logger.warning(f"Файл {file_key} пуст или некорректен")
-                return
-
-            # Очищаем названия колонок
-            sanitized_columns = [sanitize_column_name(col, COLUMNS_TO_RENAME, need_check=self.need_spec_check) for col
-                                 in reader.fieldnames]
-
-            # Проверяем обязательные колонки
-            # if 'date' not in [col.lower() for col in sanitized_columns]:
-            #     raise ValueError(f"В файле {file_key} отсутствует колонка 'date'")
-            #
-            # if 'secid' not in [col.lower() for col in sanitized_columns]:
-            #     raise ValueError(f"В файле {file_key} отсутствует колонка 'secid'")
+            elif staged:
+                logger.info(f"Добавлено {staged} записей для тикера {ticker}")
+            else:
+                logger.info(f"Нет новых данных для тикера {ticker}")
 
-            # Добавляем новые колонки в таблицу если они появились
-            self.add_missing_columns(sanitized_columns)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке файла {file_key}: {str(e)}")
+            raise
 
-            # Получаем максимальную дату для этого тикера
-            max_date = self.get_max_date_for_ticker(ticker)
+    async def stage_file(self, cursor, bucket_name: str, file_key: str, ticker: str) -> Tuple[ColumnPlan | None, int]:
+        """
+        Разбирает файл и записывает его новые строки пачками во временную таблицу транзакции файла.
 
-            # Подготавливаем данные для вставки
-            rows_to_insert = []
-            for row in reader:
-                try:
-                    row_date = datetime.strptime(row['date'], "%Y-%m-%d").date()
-
-                    if max_date is None or row_date > max_date:
-                        clean_row = {'secid': ticker}
-                        for col, value in row.items():
-                            clean_col = sanitize_column_name(col, COLUMNS_TO_RENAME, need_check=self.need_spec_check)
-                            if clean_col == 'secid':
-                                clean_row[clean_col] = value
-                            elif clean_col == 'date':
-                                clean_row[clean_col] = value
-                            else:
-                                try:
-                                    clean_row[clean_col] = float(value) if value else None
-                                except (ValueError, TypeError):
-                                    clean_row[clean_col] = 'test'
-
-                        rows_to_insert.append(clean_row)
-                except Exception as e:
-                    logger.warning(f"Ошибка при обработке строки: {str(e)}")
+        Returns:
+            План колонок файла (None для пустого файла) и число записанных строк
+        """
+        plan = None
+        max_date = None
+        rows_to_insert = []
+        staged = 0
+
+        async for text in self.stream_csv_text(bucket_name, file_key):
+            if plan is None:
+                reader = csv.reader(StringIO(text))
+                header = next(reader, None)
+                if header is None:
                     continue
+                # Очищаем названия колонок один раз для заголовка
+                plan = get_column_plan(tuple(header), self.need_spec_check)
+
+                # Добавляем новые колонки в таблицу если они появились
+                await self.run_db(self.add_missing_columns, list(plan.columns))
 
-            # Вставляем данные если есть что вставлять
-            if rows_to_insert:
-                self.insert_data(sanitized_columns, rows_to_insert)
-                logger.info(f"Добавлено {len(rows_to_insert)} записей для тикера {ticker}")
+                # Получаем максимальную дату для этого тикера
+                max_date = await self.run_db(self.get_max_date_for_ticker, ticker)
 
-                # Периодическая кластеризация (например, после каждых 10 файлов)
-                # if len(rows_to_insert) > 1000:
-                #     self.pg_client.execute(f"CLUSTER {self.main_table} USING {self.main_table}_pkey")
+                await self.run_db(self.create_stage, cursor, plan.insert_columns)
+                rows_to_insert += convert_rows(reader, plan, ticker, max_date)
+            elif self._parse_executor is not None:
+                rows_to_insert += await asyncio.get_running_loop().run_in_executor(
+                    self._parse_executor, convert_csv, text, plan, ticker, max_date)
             else:
-                logger.info(f"Нет новых данных для тикера {ticker}")
+                rows_to_insert += convert_csv(text, plan, ticker, max_date)
 
-        except Exception as e:
-            logger.error(f"Ошибка при обработке файла {file_key}: {str(e)}")
-            raise
+            # Записываем заполненные пачки строк
+            while len(rows_to_insert) >= self.batch_size:
+                batch, rows_to_insert = rows_to_insert[:self.batch_size], rows_to_insert[self.batch_size:]
+                await self.run_db(self.stage_rows, cursor, plan.insert_columns, batch)
+                staged += len(batch)
+
+        # Записываем оставшиеся строки
+        if rows_to_insert:
+            await self.run_db(self.stage_rows, cursor, plan.insert_columns, rows_to_insert)
+            staged += len(rows_to_insert)
+        return plan, staged
+
+    def commit_file(self, transaction, cursor, columns: Sequence[str] | None):
+        """
+        Переносит строки файла из временной таблицы в основную и фиксирует транзакцию файла.
+        Выполняется одним вызовом в потоке-писателе: блокировка основной таблицы снимается сразу после переноса
+        и не ждет ALTER TABLE других файлов в очереди писателей.
+        """
+        if columns:
+            self.merge_stage(cursor, columns)
+        transaction.__exit__(None, None, None)
+
+    async def run_db(self, func: Callable, *args) -> Any:
+        """
+        Выполняет блокирующий запрос к PostgreSQL в пуле потоков-писателей process_bucket
+        (или в пуле по умолчанию, если файл обрабатывается отдельно, тогда без пула соединений).
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+
+    async def stream_csv_text(self, bucket_name: str, file_key: str) -> AsyncIterator[str]:
+        """
+        Читает CSV файл из S3 частями по chunk_size байт и возвращает текст каждой части из целых записей.
+
+        Неполная последняя строка части, а также запись с переводом строки внутри кавычек, дописываются
+        следующей частью. Байты символа UTF-8, разрезанного на границе частей, декодируются вместе.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
+        async with self.s3_client.get_client() as client:
+            response = await client.get_object(Bucket=bucket_name, Key=file_key)
+            async with response["Body"] as stream:
+                while True:
+                    chunk = await stream.read(self.chunk_size)
+                    pending += decoder.decode(chunk, final=not chunk)
+                    if not chunk:
+                        break
+                    end = pending.rfind('\n') + 1
+                    # Перевод строки вне кавычек только при четном числе кавычек перед ним
+                    if end and pending.count('"', 0, end) % 2 == 0:
+                        text, pending = pending[:end], pending[end:]
+                        yield text
+        if pending:
+            yield pending
 
     def add_missing_columns(self, columns: List[str]):
         """
         Добавляет новые колонки в основную таблицу если они появились в файле.
+        Вызовы из параллельно обрабатываемых файлов выполняются по одному, чтобы ALTER TABLE не конфликтовали.
         """
-        existing_columns = self.get_table_columns()
+        with self._ddl_lock:
+            self._add_missing_columns(columns)
+
+    def _add_missing_columns(self, columns: List[str]):
+        if self._table_columns is None:
+            self._table_columns = set(self.get_table_columns())
 
         for col in columns:
-            if col.lower() not in ['secid', 'date'] and col not in existing_columns:
+            if col.lower() not in ['secid', 'date'] and col not in self._table_columns:
                 col_type = 'FLOAT'  # Все показатели кроме даты и тикера храним как FLOAT
                 query = sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {}").format(
                     sql.Identifier(self.main_table),
@@ -243,6 +504,7 @@ class S3ToPostgresETL:
                     sql.SQL(col_type)
                 )
                 self.pg_client.execute(query)
+                self._table_columns.add(col)
                 logger.info(f"Добавлена новая колонка {col} в таблицу {self.main_table}")
 
     def get_table_columns(self) -> List[str]:
@@ -268,35 +530,71 @@ class S3ToPostgresETL:
         result = self.pg_client.execute(query, (ticker,))
         return result[0][0] if result and result[0][0] else None
 
-    def insert_data(self, columns: List[str], rows: List[Dict]):
+    def insert_data(self, columns: Sequence[str], rows: List[Sequence]):
         """
-        Вставляет данные в основную таблицу.
+        Вставляет строки в основную таблицу одной транзакцией через временную таблицу.
+        Строки с уже существующим ключом (secid, date) пропускаются.
+
+        Args:
+            columns: Колонки таблицы, включая secid и date
+            rows: Значения строк в порядке columns
         """
-        # Добавляем ticker в список колонок если его нет
-        if 'secid' not in columns:
-            columns.insert(0, 'secid')
+        with self.pg_client.get_cursor() as cursor:
+            self.create_stage(cursor, columns)
+            self.stage_rows(cursor, columns, rows)
+            self.merge_stage(cursor, columns)
 
-        # Формируем SQL запрос
-        query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) ON CONFLICT (secid, date) DO NOTHING").format(
-            sql.Identifier(self.main_table),
+    def create_stage(self, cursor, columns: Sequence[str]):
+        """
+        Создает временную таблицу для строк файла, удаляемую при коммите. Типы колонок задаются явно,
+        а не через LIKE основной таблицы, чтобы открытая транзакция файла не блокировала ALTER TABLE.
+        """
+        cursor.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+            sql.Identifier(f"{self.main_table}_stage"),
+            sql.SQL(", ").join(sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(STAGE_TYPES.get(col, 'FLOAT')))
+                               for col in columns)
+        ))
+
+    def stage_rows(self, cursor, columns: Sequence[str], rows: List[Sequence]):
+        """Записывает пачку строк во временную таблицу способом, заданным в load_mode."""
+        if self.load_mode == 'copy':
+            self.copy_data(cursor, columns, rows)
+        else:
+            self.execute_insert(cursor, columns, rows)
+
+    def copy_data(self, cursor, columns: Sequence[str], rows: List[Sequence]):
+        """
+        Загружает строки во временную таблицу через COPY FROM STDIN.
+        """
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        # Пустое значение без кавычек - NULL
+        cursor.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '')").format(
+            sql.Identifier(f"{self.main_table}_stage"),
+            sql.SQL(", ").join(map(sql.Identifier, columns))
+        ), buffer)
+
+    def execute_insert(self, cursor, columns: Sequence[str], rows: List[Sequence]):
+        """
+        Вставляет строки во временную таблицу запросом INSERT на каждую строку.
+        """
+        query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+            sql.Identifier(f"{self.main_table}_stage"),
             sql.SQL(", ").join(map(sql.Identifier, columns)),
             sql.SQL(", ").join([sql.Placeholder()] * len(columns))
         )
+        cursor.executemany(query, rows)
 
-        # Подготавливаем данные для вставки
-        values = []
-        for row in rows:
-            values.append([row.get(col) for col in columns])
-
-        # Выполняем массовую вставку
-        with self.pg_client.get_cursor() as cursor:
-            cursor.executemany(query, values)
-
-    async def download_csv(self, bucket_name: str, file_key: str) -> str:
+    def merge_stage(self, cursor, columns: Sequence[str]):
         """
-        Загружает CSV файл из S3.
+        Переносит строки временной таблицы в основную одним запросом INSERT ... SELECT ... ON CONFLICT DO NOTHING.
         """
-        async with self.s3_client.get_client() as client:
-            response = await client.get_object(Bucket=bucket_name, Key=file_key)
-            async with response["Body"] as stream:
-                return (await stream.read()).decode("utf-8")
+        columns_sql = sql.SQL(", ").join(map(sql.Identifier, columns))
+        cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT (secid, date) DO NOTHING").format(
+            sql.Identifier(self.main_table),
+            columns_sql,
+            columns_sql,
+            sql.Identifier(f"{self.main_table}_stage")
+        ))
@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2 import sql, OperationalError
 from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
 from contextlib import contextmanager
 
 
@@ -20,10 +21,25 @@ class PostgresClient:
             "password": password,
             "dbname": database,
         }
+        self._pool: ThreadedConnectionPool | None = None
+
+    @contextmanager
+    def connection_pool(self, size: int):
+        """
+        Держит открытыми до size соединений на время блока: get_cursor берет соединение из пула
+        вместо нового подключения на каждый запрос. Одновременно запросы выполняют не более size потоков.
+        """
+        self._pool = ThreadedConnectionPool(1, size, **self.conn_params)
+        try:
+            yield self
+        finally:
+            pool, self._pool = self._pool, None
+            pool.closeall()
 
     @contextmanager
     def get_cursor(self):
-        conn = psycopg2.connect(**self.conn_params)
+        pool = self._pool
+        conn = pool.getconn() if pool else psycopg2.connect(**self.conn_params)
         conn.autocommit = False
         try:
             with conn.cursor(cursor_factory=DictCursor) as cursor:
@@ -33,7 +49,11 @@ class PostgresClient:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            if pool:
+                # Разорванное соединение закрывается, пул откроет новое
+                pool.putconn(conn, close=bool(conn.closed))
+            else:
+                conn.close()
 
     def execute(self, query: str, params=None):
         with self.get_cursor() as cursor:
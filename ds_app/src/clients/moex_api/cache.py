@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+import time
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+
+from typing import Tuple, Union
+
+
+class ISSResponseCache:
+    """ On-disk cache of the ISS server responses keyed by url.
+
+    History of the past trading days never changes on the server, so the responses of the `history` namespace
+    and the candles with the `till` (or `date`) parameter earlier than today never expire. All the other responses
+    (list of the securities, live cursors, etc.) expire after the ttl. When the total size of the cached
+    responses exceeds max_size the least recently used ones are evicted.
+    The cache is kept in a sqlite file and can be shared by the threads of the client.
+    """
+
+    def __init__(self, filepath: str, ttl: float = 600, max_size: int = 512 * 1024 ** 2):
+        """
+        Args:
+            filepath: path to the sqlite file of the cache
+            ttl: time to live of the live endpoint responses, seconds
+            max_size: max total size of the cached responses, bytes
+        """
+        self.filepath = filepath
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content BLOB NOT NULL,
+                encoding TEXT,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def is_immutable(url: str) -> bool:
+        """Checks whether the url requests the history of the past trading days only."""
+        parsed = urlparse(url)
+        if '/iss/history/' not in parsed.path and not parsed.path.rsplit('/', 1)[-1].startswith('candles.'):
+            return False
+        query = parse_qs(parsed.query)
+        last_date = (query.get('till') or query.get('date') or [''])[0]
+        return bool(last_date) and last_date < date.today().isoformat()
+
+    def get(self, url: str) -> Union[Tuple[bytes, str], None]:
+        """Returns the cached content of the url and its encoding or None if there is no valid entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT content, encoding, expires_at FROM responses WHERE url = ?',
+                                     (url,)).fetchone()
+            if row is None or (row[2] is not None and row[2] < now):
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+            self._conn.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, url: str, content: bytes, encoding: Union[str, None] = None):
+        """Stores the response content and evicts the least recently used entries over the size limit."""
+        if len(content) > self.max_size:
+            return
+        now = time.time()
+        expires_at = None if self.is_immutable(url) else now + self.ttl
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (url, content, encoding, len(content), expires_at, now))
+            self._size += len(content) - (old[0] if old else 0)
+            if self._size > self.max_size:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute('DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),))
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        for url, size in self._conn.execute('SELECT url, size FROM responses ORDER BY accessed_at').fetchall():
+            if self._size <= self.max_size:
+                break
+            self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self._size = 0
+
+    def close(self):
+        self._conn.close()
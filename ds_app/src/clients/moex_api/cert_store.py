@@ -0,0 +1,55 @@
+import json
+import os
+import time
+
+from typing import Any, Dict, Union
+
+
+class PassportCertStore:
+    """ Persistent store of the MOEX Passport certificates (MicexPassportCert cookies) by user.
+
+    Lets the worker processes and the repeated runs reuse a valid certificate instead of authenticating again.
+    The store is kept in a json file readable only by the owner, which is rewritten atomically on save.
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Args:
+            filepath: path to the json file with certificates. Created on the first save
+        """
+        self.filepath = filepath
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.filepath) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+
+    def get(self, user: str, margin: float = 0) -> Union[Dict[str, Any], None]:
+        """Returns the certificate of the user which is valid for at least margin seconds or None.
+
+        Returns:
+            dict: value, domain, path and expires (unix time or None for session cookies) of the cookie
+        """
+        cert = self._read().get(user)
+        if cert and (cert.get('expires') is None or cert['expires'] - margin > time.time()):
+            return cert
+        return None
+
+    def save(self, user: str, value: str, domain: str = '', path: str = '/', expires: Union[float, None] = None):
+        """Stores the certificate of the user, reading the file again to keep the certificates of the other users."""
+        certs = self._read()
+        certs[user] = {'value': value, 'domain': domain, 'path': path, 'expires': expires}
+        self._write(certs)
+
+    def delete(self, user: str):
+        certs = self._read()
+        if certs.pop(user, None) is not None:
+            self._write(certs)
+
+    def _write(self, certs: Dict[str, Dict[str, Any]]):
+        tmp_filepath = f'{self.filepath}.{os.getpid()}.tmp'
+        with open(os.open(tmp_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump(certs, file, indent=1, sort_keys=True)
+        os.replace(tmp_filepath, self.filepath)
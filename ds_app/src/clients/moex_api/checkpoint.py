@@ -0,0 +1,123 @@
+import json
+import os
+
+from typing import Any, Dict, Set, Tuple, Union
+
+from src.exception.ds_exc import InvalidArgs
+
+
+class CheckpointJournal:
+    """ Journal of the completed units of a long history download: pages of the securities and whole securities.
+
+    Every unit is recorded with the size of the output file after the unit was written and flushed. A restarted
+    run with the same arguments truncates the output to the last recorded size, dropping a partially written page,
+    appends to the same file and skips the recorded units. The journal is kept in a json lines file, one record
+    per line, and removed when the run completes.
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Args:
+            filepath: path to the journal file. Created on the first record
+        """
+        self.filepath = filepath
+        self.output: Union[str, None] = None
+        self.run: Union[Dict[str, Any], None] = None
+        self.offset = 0
+        self._pages: Set[Tuple[str, int]] = set()
+        self._securities: Set[str] = set()
+        self._last_dates: Dict[str, str] = dict()
+        self._file = None
+        if os.path.exists(self.filepath):
+            self._load()
+
+    def _load(self):
+        with open(self.filepath) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line is incomplete if the process died while writing it
+                    break
+                if 'output' in record:
+                    self.output, self.run = record['output'], record['run']
+                elif 'secid' in record and record['start'] is None:
+                    self._securities.add(record['secid'])
+                    if record.get('last_date'):
+                        self._last_dates[record['secid']] = record['last_date']
+                elif 'secid' in record:
+                    self._pages.add((record['secid'], record['start']))
+                self.offset = record.get('offset', self.offset)
+
+    def begin(self, output: str, run: Dict[str, Any]):
+        """Starts or resumes the run: checks the arguments and truncates the output to the last recorded size.
+
+        Args:
+            output: path to the output file
+            run: arguments of the run which define the output
+
+        Raises:
+            InvalidArgs: the journal belongs to another run or the output is shorter than recorded
+        """
+        run = json.loads(json.dumps(run))
+        if self.output is None:
+            self.output, self.run = output, run
+            self._append({'output': output, 'run': run})
+            return
+        if self.output != output or self.run != run:
+            raise InvalidArgs(f'The journal {self.filepath} belongs to another run: {self.run} -> {self.output}')
+        size = os.path.getsize(output) if os.path.exists(output) else 0
+        if size < self.offset:
+            raise InvalidArgs(f'The output {output} is shorter than recorded in the journal {self.filepath}')
+        with open(output, 'r+b' if size else 'ab') as file:
+            file.truncate(self.offset)
+
+    def is_done(self, secid: str, start: Union[int, None] = None) -> bool:
+        """Checks whether the security or its page starting at the start row was written."""
+        return secid in self._securities or (start is not None and (secid, start) in self._pages)
+
+    def last_date(self, secid: str) -> Union[str, None]:
+        """Returns the last trade date written for the recorded security, if it was recorded with one."""
+        return self._last_dates.get(secid)
+
+    def record(self, secid: str, offset: int, start: Union[int, None] = None, last_date: Union[str, None] = None):
+        """Records the written page of the security, or the whole security if start is None.
+
+        Args:
+            secid: name of the security
+            offset: size of the flushed output after the unit
+            start: first row of the page
+            last_date: last trade date written for the whole security, restores its watermark on resume
+        """
+        record = {'secid': secid, 'start': start, 'offset': offset}
+        if start is None:
+            self._securities.add(secid)
+            if last_date:
+                self._last_dates[secid] = record['last_date'] = last_date
+        else:
+            self._pages.add((secid, start))
+        self.offset = offset
+        self._append(record)
+
+    def mark(self, offset: int):
+        """Records the size of the flushed output without a unit, e.g. after the header."""
+        self.offset = offset
+        self._append({'offset': offset})
+
+    def complete(self):
+        """Removes the journal of the completed run."""
+        self.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+        self.__init__(self.filepath)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record: Dict[str, Any]):
+        if self._file is None:
+            self._file = open(self.filepath, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
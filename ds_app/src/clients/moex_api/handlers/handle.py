@@ -1,7 +1,22 @@
+import gzip
+import io
 import os
+import time
+from contextlib import ExitStack
 from datetime import datetime
+from functools import partial
 
-from typing import Any, Set, Dict, Tuple, Union, Type, Collection
+from typing import Any, Set, Dict, Tuple, Union, Type, Collection, TextIO, List, Callable, NamedTuple
+
+# Types of the ISS columns used by the typed (columnar and SQL) handlers. Unknown columns are kept as strings
+COLUMN_TYPES = {
+    'BOARDID': 'string', 'TRADEDATE': 'date', 'SECID': 'string', 'NUMTRADES': 'int', 'VALUE': 'float',
+    'OPEN': 'float', 'LOW': 'float', 'HIGH': 'float', 'LEGALCLOSEPRICE': 'float', 'WAPRICE': 'float',
+    'CLOSE': 'float', 'VOLUME': 'int', 'MARKETPRICE2': 'float', 'MARKETPRICE3': 'float', 'ADMITTEDQUOTE': 'float',
+    'MP2VALTRD': 'float', 'MARKETPRICE3TRADESVALUE': 'float', 'ADMITTEDVALUE': 'float', 'WAVAL': 'float',
+    'TRADINGSESSION': 'int', 'CURRENCYID': 'string', 'TRENDCLSPR': 'float',
+    'BEGIN': 'datetime', 'END': 'datetime',
+}
 
 
 class MicexISSDataHandler:
@@ -14,49 +29,376 @@ class MicexISSDataHandler:
         """
         self.container = container()
 
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """ Called by the client before the first chunk of data of the run.
+        Can be overridden to acquire resources of the output.
+        """
+        pass
+
+    def close(self):
+        """ Called by the client after the last chunk of data of the run.
+        Can be overridden to release resources of the output.
+        """
+        pass
+
+    def flush(self):
+        """ Called by the client when the data passed so far has to be persisted.
+        """
+        pass
+
+    def process_the_header(self, columns: List[str]):
+        """ Called by the client with the names of the columns before the first chunk of data.
+        By default the header is processed as a chunk with a single ';'-separated line.
+        """
+        self.process_the_data([';'.join(columns)])
+
     def process_the_data(self, market_data: Any):
         """ This handler method should be overridden to perform
         the processing of data returned by the server.
         """
         pass
 
+    def page_parser(self) -> Union[Callable[[List[str]], Any], None]:
+        """ Called by the client after the header to parse the pages in worker processes.
+        Can be overridden to return a picklable function converting a chunk of ';'-separated lines
+        into the object passed to process_the_parsed. None if the handler does not parse the data.
+        """
+        return None
+
+    def process_the_parsed(self, chunk: Any):
+        """ Called by the client with the chunks of data parsed by the page parser.
+        """
+        pass
+
 
 class CSVHandler(MicexISSDataHandler):
-    """ This handler for perform csv or parquet file.
+    """ This handler for perform csv file, optionally compressed with gzip or zstd.
+    Used as a context manager the handler keeps the file open for the whole run and writes
+    through a large buffer, one writelines call per chunk of data.
     """
+    buffer_size = 1024 * 1024
+
+    def __init__(self, container: Type):
+        super().__init__(container)
+        self._file: TextIO | None = None
+
+    def open(self):
+        self._file = _open_text_file(self.container.filepath, self.container.compression, self.buffer_size)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def checkpoint(self) -> int:
+        """ Flushes the written data and returns the size of the uncompressed file, bytes.
+        """
+        self.flush()
+        return os.fstat(self._file.fileno()).st_size
 
     def process_the_data(self, moex_data: Any):
         """ Write chunks of data into file.
         """
-        with open(self.container.filepath, 'a') as file:
-            for line in moex_data:
-                file.write(line + '\n')
+        if self._file is None:
+            with self:
+                self.process_the_data(moex_data)
+            return
+        self._file.writelines(f'{line}\n' for line in moex_data)
+
+
+class ParquetHandler(MicexISSDataHandler):
+    """ This handler converts chunks of ';'-separated lines into typed Arrow record batches
+    and streams them to a parquet file. Batches are accumulated up to the row group size of the container.
+    """
+
+    def __init__(self, container: Type):
+        super().__init__(container)
+        self.columns: List[str] = []
+        self._schema = None
+        self._writer = None
+        self._batches = []
+        self._rows = 0
+
+    def open(self):
+        self._writer = None
+        self._batches = []
+        self._rows = 0
+
+    def process_the_header(self, columns: List[str]):
+        self.columns = columns
+        self._schema = _arrow_schema(columns)
+
+    def process_the_data(self, moex_data: Any):
+        """ Parse chunk of data and write row groups when enough rows are accumulated.
+        """
+        if not moex_data:
+            return
+        self.process_the_parsed(_lines_to_record_batch(self._schema, moex_data))
+
+    def page_parser(self) -> Callable[[List[str]], Any]:
+        return partial(_lines_to_record_batch, self._schema)
+
+    def process_the_parsed(self, batch: Any):
+        """ Add record batch and write row groups when enough rows are accumulated.
+        """
+        if batch is None:
+            return
+        self._batches.append(batch)
+        self._rows += batch.num_rows
+        if self._rows >= self.container.row_group_size:
+            self._write_row_groups()
+
+    def close(self):
+        if self._schema is None:
+            return
+        self._write_row_groups(final=True)
+        if self._writer is None:
+            self._open_writer()
+        self._writer.close()
+        self._writer = None
+
+    def _open_writer(self):
+        import pyarrow.parquet as pq
+        self._writer = pq.ParquetWriter(self.container.filepath, self._schema,
+                                        compression=self.container.compression)
+
+    def _write_row_groups(self, final: bool = False):
+        """ Writes the accumulated rows as full row groups, the rest is kept until the next chunks or the end.
+        """
+        if not self._batches:
+            return
+        import pyarrow as pa
+        table = pa.Table.from_batches(self._batches, self._schema)
+        row_group_size = self.container.row_group_size
+        rows = table.num_rows if final else table.num_rows - table.num_rows % row_group_size
+        if rows:
+            if self._writer is None:
+                self._open_writer()
+            self._writer.write_table(table.slice(0, rows), row_group_size=row_group_size)
+        self._batches = table.slice(rows).to_batches()
+        self._rows = table.num_rows - rows
 
 
 class SQLHandler(MicexISSDataHandler):
-    pass
+    """ This handler streams chunks of ';'-separated lines into a Postgres table with COPY FROM STDIN.
+    Rows are copied into a temporary staging table and merged into the target table on flush and close,
+    deduplicated on the key columns of the container: the last received row wins. The staging table
+    is emptied on every commit. The client flushes after every security, so the staging table holds
+    at most one security and a failed run keeps the securities committed before the failure.
+    The whole run uses a single connection of the container's PostgresClient.
+    """
+
+    def __init__(self, container: Type):
+        super().__init__(container)
+        self.columns: List[str] = []
+        self._stack: ExitStack | None = None
+        self._cursor = None
+        self._staged = False
+
+    def open(self):
+        self._staged = False
+        self._stack = ExitStack()
+        self._cursor = self._stack.enter_context(self.container.pg_client.get_cursor())
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._merge()
+        stack, self._stack, self._cursor = self._stack, None, None
+        return stack.__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self):
+        self.__exit__(None, None, None)
+
+    def process_the_header(self, columns: List[str]):
+        from psycopg2 import sql
+        self.columns = [column.lower() for column in columns]
+        key_columns = [column.lower() for column in self.container.key_columns]
+        pg_types = {'string': 'TEXT', 'date': 'DATE', 'datetime': 'TIMESTAMP', 'int': 'BIGINT',
+                    'float': 'DOUBLE PRECISION'}
+        self._cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({keys}))').format(
+            table=sql.Identifier(self.container.table_name),
+            columns=sql.SQL(', ').join(
+                sql.SQL('{} {}').format(sql.Identifier(column.lower()),
+                                        sql.SQL(pg_types[COLUMN_TYPES.get(column, 'string')]))
+                for column in columns
+            ),
+            keys=sql.SQL(', ').join(map(sql.Identifier, key_columns)),
+        ))
+        self._cursor.execute(sql.SQL(
+            'CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+        ).format(stage=sql.Identifier(self._stage_name), table=sql.Identifier(self.container.table_name)))
+
+    def process_the_data(self, moex_data: Any):
+        """ Copy chunk of data into the staging table.
+        """
+        if not moex_data:
+            return
+        from psycopg2 import sql
+        query = sql.SQL("COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv, DELIMITER ';', NULL '')").format(
+            stage=sql.Identifier(self._stage_name),
+            columns=sql.SQL(', ').join(map(sql.Identifier, self.columns)),
+        )
+        self._cursor.copy_expert(query, io.StringIO('\n'.join(moex_data) + '\n'))
+        self._staged = True
+
+    def flush(self):
+        self._merge()
+        self._cursor.connection.commit()
+
+    @property
+    def _stage_name(self) -> str:
+        return f'{self.container.table_name}_stage'
+
+    def _merge(self):
+        """ Moves the staged rows into the target table: insert new keys, update existing ones.
+        """
+        if not self.columns or not self._staged:
+            return
+        self._staged = False
+        from psycopg2 import sql
+        key_columns = [column.lower() for column in self.container.key_columns]
+        columns = sql.SQL(', ').join(map(sql.Identifier, self.columns))
+        keys = sql.SQL(', ').join(map(sql.Identifier, key_columns))
+        updates = [sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(column))
+                   for column in self.columns if column not in key_columns]
+        self._cursor.execute(sql.SQL(
+            'INSERT INTO {table} ({columns}) '
+            'SELECT DISTINCT ON ({keys}) {columns} FROM {stage} ORDER BY {keys}, ctid DESC '
+            'ON CONFLICT ({keys}) DO {action}'
+        ).format(
+            table=sql.Identifier(self.container.table_name),
+            stage=sql.Identifier(self._stage_name),
+            columns=columns,
+            keys=keys,
+            action=sql.SQL('UPDATE SET {}').format(sql.SQL(', ').join(updates)) if updates else sql.SQL('NOTHING'),
+        ))
 
 
 class DFHandler(MicexISSDataHandler):
-    pass
+    """ This handler collects chunks of ';'-separated lines as column arrays and builds
+    a single typed pandas.DataFrame on close: SECID and BOARDID are categorical, TRADEDATE is datetime,
+    BEGIN and END of the candles are datetime, numeric columns are parsed with pandas, empty values become missing.
+    """
+    categorical_columns = ('SECID', 'BOARDID')
+
+    def __init__(self, container: Type):
+        super().__init__(container)
+        self._arrays: Dict[str, List[str]] = dict()
+
+    def open(self):
+        self._arrays = dict()
+        self.container.df = None
+
+    def process_the_header(self, columns: List[str]):
+        self._arrays = {column: [] for column in columns}
+
+    def page_parser(self) -> Callable[[List[str]], Any]:
+        return _lines_to_columns
+
+    def process_the_parsed(self, columns: Any):
+        """ Extend the column arrays with the columns of a chunk split in a worker process.
+        """
+        for array, values in zip(self._arrays.values(), columns):
+            array.extend(values)
+
+    def process_the_data(self, moex_data: Any):
+        """ Split chunk of data into columns and extend the column arrays.
+        """
+        if not moex_data:
+            return
+        for array, values in zip(self._arrays.values(), zip(*(line.split(';') for line in moex_data))):
+            array.extend(values)
+
+    def close(self):
+        import pandas as pd
+        df = _columns_to_frame(self._arrays)
+        for column in self.categorical_columns:
+            if column in df:
+                df[column] = pd.Categorical(df[column])
+        self.container.df = df
+        self._arrays = dict()
+
+
+def _columns_to_frame(arrays: Dict[str, List[str]]):
+    """ Builds pandas.DataFrame of the string column arrays converting the values by COLUMN_TYPES.
+    """
+    import pandas as pd
+    data = dict()
+    for column, values in arrays.items():
+        column_type = COLUMN_TYPES.get(column, 'string')
+        if column_type == 'date':
+            data[column] = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+        elif column_type == 'datetime':
+            data[column] = pd.to_datetime(values, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        elif column_type in ('int', 'float'):
+            numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+            data[column] = numbers.astype('Int64') if column_type == 'int' else numbers.astype('float64')
+        else:
+            data[column] = pd.Series(values, dtype=object)
+    return pd.DataFrame(data)
+
+
+def _lines_to_columns(lines: List[str]) -> List[Tuple[str, ...]]:
+    """ Splits ';'-separated lines into the tuples of the column values.
+    """
+    return list(zip(*(line.split(';') for line in lines)))
+
+
+class ParsedPage(NamedTuple):
+    """ Page parsed in a worker process: the chunk for process_the_parsed, the last TRADEDATE of the page
+    and the duration of the parsing, seconds.
+    """
+    chunk: Any
+    last_date: str
+    seconds: float
+
+
+def parse_page(parser: Callable[[List[str]], Any], date_idx: int, lines: List[str]) -> ParsedPage:
+    """ Parses a page of ';'-separated lines with the page parser of a handler. Runs in the worker processes.
+    """
+    start_time = time.perf_counter()
+    chunk = parser(lines)
+    return ParsedPage(chunk, max((line.split(';')[date_idx] for line in lines), default=''),
+                      time.perf_counter() - start_time)
 
 
 class CSVContainer:
     """ Container that will be used by the handler to store data in csv or parquet file.
     Kept separately from the handler for scalability purposes: in order
     to differentiate storage and output from the processing.
+    The compression of the csv file is defined by the extension: .gz for gzip, .zst for zstd.
     """
 
+    default_extension = '.csv'
+
     def __init__(self):
         self.filepath = None
+        self.compression = None
 
-    def set_filepath(self, filepath: str):
+    def set_filepath(self, filepath: str, append: bool = False):
+        """
+        Args:
+            filepath: path to the file. A new name is chosen if the file exists
+            append: append to the existing file instead of choosing a new name
+        """
         self.filepath = filepath
+        self.compression = COMPRESSION_BY_EXTENSION.get(os.path.splitext(filepath)[1]) if filepath else None
         if self.filepath is None:
             current_time = datetime.now().strftime("%Y%m%d%H%M%S")
-            filepath = f"{current_time}.csv"
+            filepath = f"{current_time}{self.default_extension}"
             self.set_filepath(filepath=filepath)
-        else:
+        elif not append:
             if os.path.exists(self.filepath):
                 base_name, ext = os.path.splitext(self.filepath)
                 count = 1
@@ -68,9 +410,98 @@ class CSVContainer:
                     count += 1
 
 
+class ParquetContainer(CSVContainer):
+    """ Container that will be used by the handler to store data in parquet file.
+    """
+    default_extension = '.parquet'
+
+    def __init__(self):
+        super().__init__()
+        self.row_group_size = 128 * 1024
+
+    def set_filepath(self, filepath: str, compression: str = 'zstd', row_group_size: int = 128 * 1024):
+        """
+        Args:
+            filepath: path to the parquet file
+            compression: parquet compression codec: zstd, snappy, gzip, lz4, brotli or none
+            row_group_size: max number of rows in a row group
+        """
+        super().set_filepath(filepath)
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+
+COMPRESSION_BY_EXTENSION = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+def _open_text_file(filepath: str, compression: str | None, buffer_size: int) -> TextIO:
+    """ Opens text file for appending through a buffer of the given size, compressing it on the fly if needed.
+    """
+    if compression is None:
+        return open(filepath, 'a', buffering=buffer_size, encoding='utf-8')
+    if compression == 'gzip':
+        binary = gzip.GzipFile(filepath, 'ab', compresslevel=6)
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError('zstd compression requires the zstandard package') from e
+        binary = zstandard.ZstdCompressor().stream_writer(open(filepath, 'ab'), closefd=True)
+    else:
+        raise ValueError(f'Unsupported compression: {compression}')
+    return io.TextIOWrapper(io.BufferedWriter(binary, buffer_size), encoding='utf-8')
+
+
+def _arrow_schema(columns: List[str]):
+    import pyarrow as pa
+    arrow_types = {'string': pa.string(), 'date': pa.date32(), 'datetime': pa.timestamp('s'), 'int': pa.int64(),
+                   'float': pa.float64()}
+    return pa.schema([(column, arrow_types[COLUMN_TYPES.get(column, 'string')]) for column in columns])
+
+
+def _lines_to_record_batch(schema, lines: List[str]):
+    """ Parses ';'-separated lines into a typed record batch with the Arrow csv reader. Empty values become nulls.
+    None for an empty chunk.
+    """
+    if not lines:
+        return None
+    import pyarrow as pa
+    from pyarrow import csv
+    table = csv.read_csv(
+        io.BytesIO('\n'.join(lines).encode('utf-8')),
+        read_options=csv.ReadOptions(column_names=schema.names),
+        parse_options=csv.ParseOptions(delimiter=';', quote_char=False),
+        convert_options=csv.ConvertOptions(column_types=schema, strings_can_be_null=True),
+    )
+    return pa.RecordBatch.from_pydict({name: table.column(name).combine_chunks() for name in schema.names},
+                                      schema=schema)
+
+
 class SQLContainer:
-    pass
+    """ Container that will be used by the handler to store data in a Postgres table.
+    """
+
+    def __init__(self):
+        self.pg_client = None
+        self.table_name = None
+        self.key_columns = ('SECID', 'BOARDID', 'TRADEDATE')
+
+    def set_connection(self, pg_client, table_name: str,
+                       key_columns: Tuple[str, ...] = ('SECID', 'BOARDID', 'TRADEDATE')):
+        """
+        Args:
+            pg_client: PostgresClient of the target database
+            table_name: target table, created if it does not exist
+            key_columns: columns of the primary key used for deduplication
+        """
+        self.pg_client = pg_client
+        self.table_name = table_name
+        self.key_columns = key_columns
 
 
 class DFContainer:
-    pass
+    """ Container that will be used by the handler to keep the resulting pandas.DataFrame.
+    """
+
+    def __init__(self):
+        self.df = None
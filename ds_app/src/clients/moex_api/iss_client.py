@@ -6,15 +6,35 @@
 
     @copyright: 2025 by Aleksandr Berezhnoy
 """
-from typing import List
+import asyncio
+import multiprocessing
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from datetime import date, timedelta
+from typing import List, Callable, Iterable, Awaitable
+from urllib.parse import urlencode, quote
+import aiohttp
 import requests
 from requests import Response
 from requests.auth import HTTPBasicAuth
+from requests.cookies import remove_cookie_by_name
 import time
 
 import logging
-from src.exception.ds_exc import InvalidArgs
+from src.exception.ds_exc import InvalidArgs, ISSRequestError
 from src.clients.moex_api.handlers.handle import *
+from src.clients.moex_api.watermarks import WatermarkStore
+from src.clients.moex_api.checkpoint import CheckpointJournal
+from src.clients.moex_api.cert_store import PassportCertStore
+from src.clients.moex_api.cache import ISSResponseCache
+from src.clients.moex_api.ratelimit import RequestGovernor
+from src.clients.moex_api.json_stream import read_block, read_block_columns
+from src.clients.moex_api.transport import AsyncISSTransport
+from src.clients.moex_api.metrics import MetricsRegistry, Histogram, BYTES_BUCKETS, ROWS_BUCKETS
 from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
@@ -35,16 +55,22 @@ logger.addHandler(file_handler)
 
 class UrlBuilder:
 
-    def __init__(self):
-        self._SYSTEM_PREFIX = 'https://iss.moex.com/'
-        self._NAMESPACE = {'trading_system': 'iss', 'trading_results': 'iss/history'}
+    def __init__(self, system_prefix: str = 'https://iss.moex.com/'):
+        """
+        Args:
+            system_prefix: ISS server address. Can be replaced with a local stand-in server for tests and benchmarks
+        """
+        self._SYSTEM_PREFIX = system_prefix
+        self._NAMESPACE = {'trading_system': 'iss', 'trading_results': 'iss/history', 'statistics': 'iss/statistics'}
         self.DEFAULT_EMB = {'engines': 'stock', 'markets': 'shares'}
 
     def build_url(self, response_format: str = 'json',
                   namespace: str = 'trading_results',
                   emb: Union[Dict[str, str] | None] = None,
                   sec_id: Union[str, None] = None,
-                  params: Union[Dict[str, str], None] = None):
+                  params: Union[Dict[str, str], None] = None,
+                  collection: str = 'securities',
+                  resource: Union[str, None] = None):
         """A method for constructing a URL for a request to the ISS server
 
         Args:
@@ -53,32 +79,108 @@ class UrlBuilder:
             emb (dict | None, optional): Values for engines, markets, boards. Defaults to None.
             sec_id (str | None, optional): Name of the security for filtering. Defaults to None.
             params (dict | None, optional): Url parameters. Defaults to None.
+            collection (str, optional): Collection of the requested objects, e.g. analytics. Defaults to 'securities'.
+            resource (str | None, optional): Resource of the security, e.g. candles. Defaults to None.
 
         Returns:
             str: url string
         """
-        url_string = f'{self._SYSTEM_PREFIX}{self._NAMESPACE[namespace]}'
-        for param, arg in emb.items():
-            url_string += f'/{param}/{arg}'
         if sec_id:
-            url_string += f'/securities/{sec_id}.{response_format}'
+            url_string = self._collection_path(namespace, emb, collection) + \
+                f'{sec_id}{f"/{resource}" if resource else ""}.{response_format}'
         else:
-            url_string += f'/securities.{response_format}'
+            url_string = f'{self._collection_path(namespace, emb, collection)[:-1]}.{response_format}'
+        return f'{url_string}?{self.encode(params)}' if params else url_string
+
+    def prepare(self, response_format: str = 'json',
+                namespace: str = 'trading_results',
+                emb: Union[Dict[str, str] | None] = None,
+                params: Union[Dict[str, str], None] = None,
+                collection: str = 'securities',
+                resource: Union[str, None] = None) -> 'PreparedUrl':
+        """Compiles the url template of the securities of a collection, shared by all the securities and pages.
+        See build_url for the description of the arguments.
+
+        Returns:
+            PreparedUrl: template producing the urls of the securities
+        """
+        return PreparedUrl(self._collection_path(namespace, emb, collection),
+                           f'{f"/{resource}" if resource else ""}.{response_format}', params)
+
+    def _collection_path(self, namespace: str, emb: Union[Dict[str, str], None], collection: str) -> str:
+        return ''.join([self._SYSTEM_PREFIX, self._NAMESPACE[namespace],
+                        *(f'/{param}/{arg}' for param, arg in (emb or {}).items()), f'/{collection}/'])
+
+    @staticmethod
+    def encode(params: Dict[str, Any]) -> str:
+        """Url-encodes the query parameters. Commas of the column lists are kept as is."""
+        return urlencode(params, safe=',', quote_via=quote)
+
+
+class SecurityUrl:
+    """ Urls of a security produced by PreparedUrl: the url, its pages and its cursor.
+    """
+    __slots__ = ('url', 'cursor', '_page_prefix')
+
+    def __init__(self, url: str, cursor: Union[str, None]):
+        self.url = url
+        self.cursor = cursor
+        self._page_prefix = f'{url}&start=' if '?' in url else f'{url}?start='
+
+    def page(self, start: int) -> str:
+        """Url of the page starting at the start row."""
+        return f'{self._page_prefix}{start}'
+
+    def __str__(self):
+        return self.url
+
+
+class PreparedUrl:
+    """ Url template of a collection compiled once per namespace, emb, format and params.
+
+    The query string is encoded once, the url of a security is a concatenation of the prepared parts.
+    If the params select a block with iss.only, the cursor url of the block is prepared as well.
+    """
+
+    def __init__(self, prefix: str, suffix: str, params: Union[Dict[str, Any], None] = None):
+        """
+        Args:
+            prefix: url of the collection ending with a slash
+            suffix: part of the path after the security name, e.g. '.csv' or '/candles.csv'
+            params: url parameters
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+        self.params = dict(params) if params else dict()
+        self.query = self._query(self.params)
+        self.cursor_query = self._cursor_query(self.params)
+
+    def for_security(self, sec_id: str, **params: Any) -> SecurityUrl:
+        """Urls of the security. Params override the parameters of the template, e.g. the dates of a chunk."""
+        path = f'{self.prefix}{sec_id}{self.suffix}'
         if params:
-            url_string += '?'
-            for param, arg in params.items():
-                if url_string.endswith('?'):
-                    url_string += f'{param}={arg}'
-                else:
-                    url_string += f'&{param}={arg}'
-            return url_string
+            params = {**self.params, **params}
+            query, cursor_query = self._query(params), self._cursor_query(params)
         else:
-            return url_string
+            query, cursor_query = self.query, self.cursor_query
+        return SecurityUrl(f'{path}?{query}' if query else path, f'{path}?{cursor_query}' if cursor_query else None)
+
+    @staticmethod
+    def _query(params: Dict[str, Any]) -> str:
+        return UrlBuilder.encode(params)
+
+    @staticmethod
+    def _cursor_query(params: Dict[str, Any]) -> Union[str, None]:
+        block = params.get('iss.only')
+        if not block or ',' in block:
+            return None
+        return UrlBuilder.encode({**params, 'iss.only': f'{block}.cursor', 'iss.meta': 'off'})
 
 
 class Config:
 
-    def __init__(self, user: str = '', password: str = '', proxy_url: str = '', debug_level: int = 0):
+    def __init__(self, user: str = '', password: str = '', proxy_url: str = '', debug_level: int = 0,
+                 cert_store_path: str = '', refresh_margin: float = 300, auth_retry_interval: float = 300):
         """ Container for all the configuration options:
 
         Args:
@@ -86,83 +188,123 @@ class Config:
             password: password for this user
             proxy_url: proxy URL if any is used, specified as http://proxy:port
             debug_level: 0 - no output, 1 - send debug info to stdout
+            cert_store_path: json file keeping the MOEX Passport certificate between processes and runs.
+                Disabled if empty
+            refresh_margin: the certificate is renewed when it expires in less than this number of seconds
+            auth_retry_interval: after a failed authentication the next one is not attempted for this number
+                of seconds, the requests are sent without the certificate
         """
         self.proxy_url = proxy_url
         self.debug_level = debug_level
         self.user = user
         self.password = password
         self.auth_url = 'https://passport.moex.com/authenticate'
+        self.cert_store_path = cert_store_path
+        self.refresh_margin = refresh_margin
+        self.auth_retry_interval = auth_retry_interval
 
 
 class MicexAuth:
-    """User authentication data and functions."""
+    """User authentication data and functions.
+
+    If the config has a certificate store, a valid certificate saved by another process or run is reused
+    instead of authenticating, and a new certificate is saved for the others. A failed authentication
+    is not repeated for auth_retry_interval seconds of the config.
+    """
 
     def __init__(self, config: Config):
         self.passport = None
+        self.expires: float | None = None
         self.config = config
         self.session = requests.Session()
         self.cookies = self.session.cookies
         self.cookie_name = 'MicexPassportCert'
-        self.auth()
+        self.store = PassportCertStore(config.cert_store_path) if config.cert_store_path else None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        if not self._load_cert():
+            self.auth()
 
     def auth(self):
         """Makes a GET request with Basic Authentication."""
+        # cleared on success, also set if the request raises
+        self._retry_at = time.time() + self.config.auth_retry_interval
+        remove_cookie_by_name(self.cookies, self.cookie_name)
         response = self.session.get(
             self.config.auth_url,
             auth=HTTPBasicAuth(self.config.user, self.config.password)
         )
         if response.status_code == 200:
-            cert = self.session.cookies.get('MicexPassportCert')
-            if cert:
-                self.passport = cert
+            cookie = next((cookie for cookie in self.cookies if cookie.name == self.cookie_name), None)
+            if cookie:
+                self.passport, self.expires = cookie.value, cookie.expires
+                self._retry_at = 0.0
+                if self.store:
+                    self.store.save(self.config.user, cookie.value, cookie.domain, cookie.path, cookie.expires)
                 logger.info('Авторизация прошла успешно!')
             else:
                 logger.warning('Ошибка: сертификат не найден в ответе.')
         else:
             logger.warning(f'Ошибка авторизации: {response.status_code}')
 
-    def _is_cookie_expired(self) -> bool:
-        for cookie in self.cookies:
-            if cookie.name == self.cookie_name:
-                if cookie.expires:
-                    expiration_time = datetime.fromtimestamp(cookie.expires)
-                    if expiration_time > datetime.now():
-                        logger.info(f'Cookie "{self.cookie_name}" действителен до {expiration_time}')
-                        return False
-                    else:
-                        logger.info(f'Cookie "{self.cookie_name}" истек {expiration_time}')
-                        return True
-                else:
-                    logger.info(f'Cookie "{self.cookie_name}" не имеет срока действия (сессионный)')
-                    return False
-        logger.warning(f'Cookie "{self.cookie_name}" не найден')
+    def _load_cert(self) -> bool:
+        """Sets the certificate of the store into the session if it is valid for longer than the refresh margin."""
+        cert = self.store.get(self.config.user, self.config.refresh_margin) if self.store else None
+        if not cert:
+            return False
+        remove_cookie_by_name(self.cookies, self.cookie_name)
+        self.cookies.set(self.cookie_name, cert['value'], domain=cert['domain'], path=cert['path'],
+                         expires=cert['expires'])
+        self.passport, self.expires = cert['value'], cert['expires']
+        logger.info(f'Cookie "{self.cookie_name}" загружен из хранилища {self.store.filepath}')
         return True
 
-    def ensure_auth(self) -> bool:
-        """Repeats backend_api request if failed last time or cookie expired."""
-        is_cookie_expired = self._is_cookie_expired()
-        if not self.passport or is_cookie_expired:
-            self.auth()
-        if self.passport and not is_cookie_expired:
+    def _is_cookie_expired(self, margin: float = 0) -> bool:
+        """Checks the expiration time of the certificate kept on authentication, session cookies never expire."""
+        if not self.passport:
             return True
-        return False
+        return self.expires is not None and self.expires - margin <= time.time()
+
+    def needs_refresh(self) -> bool:
+        """Checks without requests whether ensure_auth would renew the certificate."""
+        return self._is_cookie_expired(self.config.refresh_margin) and time.time() >= self._retry_at
+
+    def ensure_auth(self) -> bool:
+        """Repeats backend_api request if failed last time or the cookie expires within the refresh margin.
+        A failed request is not repeated until the retry interval has passed.
+        """
+        if self.needs_refresh():
+            with self._lock:
+                # another thread may have renewed the certificate while this one was waiting
+                if self.needs_refresh() and not self._load_cert():
+                    if self.passport:
+                        logger.info(f'Cookie "{self.cookie_name}" истекает {datetime.fromtimestamp(self.expires)}, '
+                                    f'повторная авторизация')
+                    self.auth()
+        return not self._is_cookie_expired()
 
 
 def timer(func):
-    """
+    """Logs the execution time of the method and observes it in the metrics registry of the client
+    as iss_method_duration_seconds with the method label.
 
     Args:
-        func:
+        func: method of MicexISSClient or a function
 
     Returns:
-
+        function: the wrapped function
     """
 
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
+        start_time = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            execution_time = time.perf_counter() - start_time
+            metrics = getattr(args[0], 'metrics', None) if args else None
+            if isinstance(metrics, MetricsRegistry):
+                metrics.histogram('iss_method_duration_seconds', 'Duration of the client methods',
+                                  method=func.__name__).observe(execution_time)
 
         hours, rem = divmod(execution_time, 3600)
         minutes, seconds = divmod(rem, 60)
@@ -176,6 +318,33 @@ def timer(func):
     return wrapper
 
 
+class SecuritiesUniverse:
+    """ Parsed list of the shares indexed by SECID and by listing level.
+    """
+
+    def __init__(self, securities: Set[Tuple[str, str, str, str, int]]):
+        """
+        Args:
+            securities: tuples of SECID, SHORTNAME, SECNAME, SECTYPE and LISTLEVEL
+        """
+        self.securities = securities
+        self.by_secid: Dict[str, Tuple[str, str, str, str, int]] = dict()
+        self.by_level: Dict[int, List[str]] = dict()
+        for sec in securities:
+            self.by_secid[sec[0]] = sec
+            self.by_level.setdefault(sec[4], []).append(sec[0])
+        self.loaded_at = time.monotonic()
+
+    def is_expired(self, ttl: float) -> bool:
+        return time.monotonic() - self.loaded_at > ttl
+
+
+def _float_or_none(num: Union[int, float, str, None]) -> Union[float, None]:
+    """ Converts ISS value to float keeping nulls
+    """
+    return None if num is None or num == '' else float(num)
+
+
 def _del_null(num: Union[int, float, None]) -> Union[int, float]:
     """ Replaces null string with zero
     """
@@ -185,17 +354,38 @@ def _del_null(num: Union[int, float, None]) -> Union[int, float]:
 class MicexISSClient:
     """ Methods for interacting with the MICEX ISS server.
     """
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # Max number of candles in a response of the server
+    CANDLES_PAGE_SIZE = 500
+    # Length of the date range of a candles request for each interval, days. Chunks hold a few pages each
+    CANDLE_CHUNK_DAYS = {1: 7, 10: 60, 60: 365, 24: 3650}
+    CANDLE_COLUMNS = ('BEGIN', 'END', 'OPEN', 'CLOSE', 'HIGH', 'LOW', 'VALUE', 'VOLUME')
 
     def __init__(self, auth: MicexAuth | None = None, handler: Type[MicexISSDataHandler] | None = None,
-                 container: Type | None = None):
+                 container: Type | None = None, cache: ISSResponseCache | None = None,
+                 universe_ttl: float = 3600, governor: RequestGovernor | None = None,
+                 transport: AsyncISSTransport | None = None, metrics: MetricsRegistry | None = None):
         """
         Args:
             auth: instance of the MicexAuth class with authentication info
             handler: user's handler class inherited from MicexISSDataHandler
             container: user's container class
+            cache: on-disk cache of the server responses. Disabled by default
+            universe_ttl: time to live of the list of the securities kept in memory, seconds
+            governor: rate limiter and retry policy shared by all the requests of the client
+            transport: pooled aiohttp session used by all the async methods of the client
+            metrics: registry of the request, page and security metrics. Export it with to_prometheus or to_json
         """
         self.auth = auth
+        self.cache = cache
+        self.governor = governor if governor else RequestGovernor()
+        self.transport = transport if transport else AsyncISSTransport(timeout=self.governor.timeout)
+        self.metrics = metrics if metrics else MetricsRegistry()
+        self.universe_ttl = universe_ttl
+        self._universe: SecuritiesUniverse | None = None
+        self._parse_executor: ProcessPoolExecutor | None = None
         self.handlers = {'csv': CSVHandler(CSVContainer),
+                         'parquet': ParquetHandler(ParquetContainer),
                          'sql': SQLHandler(SQLContainer),
                          'df': DFHandler(DFContainer)}
         if handler and container:
@@ -205,41 +395,44 @@ class MicexISSClient:
             logger.info('The client will use the built-in handlers')
         self.url_builder = UrlBuilder()
 
-    def get_stock_exchange_list(self) -> Set[Tuple[str, str, str, str, int]]:
+    def get_stock_exchange_list(self, refresh: bool = False) -> Set[Tuple[str, str, str, str, int]]:
         """Get list of shares and listing level
 
+        Args:
+            refresh: download the list even if the one kept in memory has not expired
+
         Returns:
             set: Tuples of the unique names of the securities with listing level
         """
+        universe = self.get_securities_universe(refresh)
+        return universe.securities if universe else None
+
+    def get_securities_universe(self, refresh: bool = False) -> SecuritiesUniverse:
+        """Get list of shares indexed by SECID and listing level. The list is kept in memory for universe_ttl seconds
+
+        Args:
+            refresh: download the list even if the one kept in memory has not expired
+
+        Returns:
+            SecuritiesUniverse: list of shares with indexes
+        """
+        if not refresh and self._universe and not self._universe.is_expired(self.universe_ttl):
+            return self._universe
+
+        columns = ('SECID', 'SHORTNAME', 'SECNAME', 'SECTYPE', 'LISTLEVEL')
         url = self.url_builder.build_url(
             namespace='trading_system',
-            emb=self.url_builder.DEFAULT_EMB
+            emb=self.url_builder.DEFAULT_EMB,
+            params={'iss.only': 'securities', 'iss.meta': 'off', 'securities.columns': ','.join(columns)}
         )
 
         try:
-            jres = self._get_get(url).json()
-            jsec = jres['securities']
-            jdata = jsec['data']
-            jcols = jsec['columns']
-            sec_idx = jcols.index('SECID')
-            short_name_idx = jcols.index('SHORTNAME')
-            name_idx = jcols.index('SECNAME')
-            type_idx = jcols.index('SECTYPE')
-            level_idx = jcols.index('LISTLEVEL')
-
-            share_listing = set()
-            for sec in jdata:
-                if sec[type_idx] in ('1', '2'):
-                    share_listing.add(
-                        (
-                            sec[sec_idx],
-                            sec[short_name_idx],
-                            sec[name_idx],
-                            sec[type_idx],
-                            sec[level_idx],
-                        )
-                    )
-            return share_listing
+            response = self._get_get(url, stream=True)
+            share_listing = {sec for sec in read_block(response.iter_content(self.STREAM_CHUNK_SIZE),
+                                                       'securities', columns)
+                             if sec[3] in ('1', '2')}
+            self._universe = SecuritiesUniverse(share_listing)
+            return self._universe
         except AttributeError as e:
             logger.exception(e, exc_info=False)
 
@@ -249,13 +442,123 @@ class MicexISSClient:
                         list_level: int = None,
                         sec_ids: Set[str] = None,
                         date_interval: str = None,
-                        filepath: str = None):
-        """Get historical data and convert it in csv or parquet format"""
+                        filepath: str = None,
+                        concurrency: int | None = None,
+                        page_workers: int = 1,
+                        watermarks: WatermarkStore | None = None,
+                        journal: CheckpointJournal | None = None):
+        """Get historical data and convert it in csv or parquet format
+
+        Args:
+            emb: values for engines, markets, boards. Defaults to stock/shares
+            primary_board: receive data only for the primary board of the security
+            list_level: listing level of the securities, from 1 to 3
+            sec_ids: names of the securities
+            date_interval: 'from till' dates separated by a space
+            filepath: output file path
+            concurrency: if set, the history is fetched with asyncio (aiohttp) keeping at most
+                this number of requests in flight across securities and pages. The output is the same
+                as in the sequential mode: rows are written per security in the order of the list of stocks
+            page_workers: number of threads fetching pages of a security in parallel in the sequential mode.
+                Pages are written in the order of their offsets
+            watermarks: store of the last received trade dates for incremental sync. If set, each security
+                is requested from the day after its watermark. The watermarks are moved forward as the
+                securities are written and saved once the output is closed
+            journal: checkpoint journal of the run. Written pages and securities are recorded in it, so the run
+                restarted with the same journal and arguments appends to the same file and continues from the last
+                recorded page. The journal is removed when the run completes. Only uncompressed csv is supported
+        """
+        self._check_execution_args(concurrency, page_workers)
         # Define a handler
         handler = self.handlers['csv']
-        # Set the file path
-        handler.container.set_filepath(filepath=filepath)
+        # Set the file path, the resumed run appends to the output of the journal
+        if journal and journal.output:
+            handler.container.set_filepath(filepath=journal.output, append=True)
+        else:
+            handler.container.set_filepath(filepath=filepath)
+        if journal:
+            if handler.container.compression:
+                raise InvalidArgs('The resumable download supports only uncompressed csv files.')
+            journal.begin(handler.container.filepath, {
+                'emb': emb, 'primary_board': primary_board, 'list_level': list_level,
+                'sec_ids': sorted(sec_id.upper() for sec_id in sec_ids) if sec_ids else None,
+                'date_interval': date_interval})
+        completed = False
+        try:
+            with handler:
+                self._get_history(handler, emb, primary_board, list_level, sec_ids, date_interval,
+                                  concurrency, page_workers, watermarks, journal)
+            completed = True
+        finally:
+            if journal:
+                journal.close()
+            # the output of the interrupted journaled run is kept and resumed, so are the watermarks of its securities
+            if watermarks and (completed or journal):
+                watermarks.save()
+        if journal:
+            journal.complete()
+
+    @timer
+    def get_history_parquet(self, emb: Dict[str, str] = None,
+                            primary_board: bool = False,
+                            list_level: int = None,
+                            sec_ids: Set[str] = None,
+                            date_interval: str = None,
+                            filepath: str = None,
+                            compression: str = 'zstd',
+                            row_group_size: int = 128 * 1024,
+                            concurrency: int | None = None,
+                            page_workers: int = 1,
+                            watermarks: WatermarkStore | None = None,
+                            parse_workers: int | None = None):
+        """Get historical data with typed columns and write it to a parquet file
 
+        Args:
+            compression: parquet compression codec
+            row_group_size: max number of rows in a row group
+            parse_workers: number of processes converting the pages into Arrow record batches. Requires
+                the concurrency: pages are fetched by async tasks, parsed in the process pool and written
+                by the single writer in the order of the securities. The pool is started on the first call
+                (about half a second for spawn) and kept by the client until shutdown or aclose, so the mode
+                pays off only for large loads where parsing in the main process is the bottleneck
+            See get_history_csv for the description of the other arguments.
+        """
+        self._check_execution_args(concurrency, page_workers, parse_workers)
+        handler = self.handlers['parquet']
+        handler.container.set_filepath(filepath=filepath, compression=compression, row_group_size=row_group_size)
+        with handler:
+            self._get_history(handler, emb, primary_board, list_level, sec_ids, date_interval,
+                              concurrency, page_workers, watermarks, parse_workers=parse_workers)
+        if watermarks:
+            watermarks.save()
+
+    @staticmethod
+    def _check_execution_args(concurrency: int | None, page_workers: int, parse_workers: int | None = None):
+        if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+            raise InvalidArgs('The concurrency should be a positive integer.')
+        if not isinstance(page_workers, int) or page_workers < 1:
+            raise InvalidArgs('The number of page workers should be a positive integer.')
+        if parse_workers is not None:
+            if not isinstance(parse_workers, int) or parse_workers < 1:
+                raise InvalidArgs('The number of parse workers should be a positive integer.')
+            if not concurrency:
+                raise InvalidArgs('The parse workers require the concurrency.')
+
+    def _get_history(self, handler: MicexISSDataHandler,
+                     emb: Dict[str, str] | None,
+                     primary_board: bool,
+                     list_level: int | None,
+                     sec_ids: Set[str] | None,
+                     date_interval: str | None,
+                     concurrency: int | None,
+                     page_workers: int,
+                     watermarks: WatermarkStore | None,
+                     journal: CheckpointJournal | None = None,
+                     parse_workers: int | None = None):
+        """Receives history of the securities and passes it page by page to the opened handler.
+        See get_history_csv and get_history_parquet for the description of the arguments.
+        The journal requires the CSVHandler.
+        """
         # Define params
         params = {'iss.only': 'history',
                   'history.columns': 'BOARDID,TRADEDATE,SECID,NUMTRADES,VALUE,OPEN,LOW,HIGH,LEGALCLOSEPRICE,WAPRICE,'
@@ -270,87 +573,649 @@ class MicexISSClient:
         # Define a list of securities
         stocks = self._get_list_of_stocks(list_level, sec_ids)
         logger.info(f'Data will be received for the following stocks: {stocks}')
-        # Write columns
-        columns = list()
-        columns.append(params['history.columns'].replace(',', ';'))
-        handler.process_the_data(columns)
+        # Write columns unless the output is resumed
+        if not (journal and journal.offset):
+            handler.process_the_header(params['history.columns'].split(','))
+            if journal:
+                journal.mark(handler.checkpoint())
+
+        # Build history urls, in the incremental mode starting from the day after the watermark
+        emb = emb if emb else self.url_builder.DEFAULT_EMB
+        prepared_url = self.url_builder.prepare(response_format='csv', emb=emb, params=params)
+        urls = dict()
+        for stock in stocks:
+            if journal and journal.is_done(stock):
+                logger.info(f'{stock} was loaded by the interrupted run')
+                # the interrupted run may have died before saving the watermarks
+                if watermarks and journal.last_date(stock):
+                    watermarks.update(emb, stock, journal.last_date(stock))
+                continue
+            next_date = watermarks.next_date(emb, stock) if watermarks else None
+            if next_date and next_date > params.get('from', ''):
+                if next_date > params.get('till', next_date):
+                    logger.info(f'{stock} is up to date')
+                    continue
+                urls[stock] = prepared_url.for_security(stock, **{'from': next_date})
+            else:
+                urls[stock] = prepared_url.for_security(stock)
+        stocks = list(urls)
+        date_idx = params['history.columns'].split(',').index('TRADEDATE')
+
+        write_duration = self.metrics.histogram('iss_write_duration_seconds',
+                                                'Handling of the pages by the handler: parsing and output')
+        security_duration = self.metrics.histogram('iss_security_duration_seconds',
+                                                   'Download and output of the history of a security')
+
+        def write_pages(stock: str, pages: Iterable[Tuple[int, List[str] | ParsedPage]]):
+            last_date = ''
+            for start, data in pages:
+                if isinstance(data, ParsedPage):
+                    self.metrics.histogram('iss_parse_duration_seconds',
+                                           'Parsing of the pages in the worker processes').observe(data.seconds)
+                    with write_duration.time():
+                        handler.process_the_parsed(data.chunk)
+                    last_date = max(last_date, data.last_date)
+                else:
+                    with write_duration.time():
+                        handler.process_the_data(data)
+                    if (watermarks or journal) and data:
+                        last_date = max(last_date, max(line.split(';')[date_idx] for line in data))
+                if journal:
+                    journal.record(stock, handler.checkpoint(), start)
+            # persist the security, e.g. commit it to the database
+            handler.flush()
+            if watermarks and last_date:
+                watermarks.update(emb, stock, last_date)
+            if journal:
+                journal.record(stock, handler.checkpoint(), last_date=last_date or None)
+            logger.info(f'Data loading for {stock} is completed')
+
+        if concurrency:
+            page_parser = handler.page_parser() if parse_workers else None
+            executor = self._get_parse_executor(parse_workers) if page_parser else None
+            try:
+                self._run_async(self._get_history_async(
+                    stocks, urls, write_pages, concurrency, journal, executor,
+                    partial(parse_page, page_parser, date_idx) if executor else None, security_duration))
+            except BrokenProcessPool:
+                self.shutdown()
+                raise
+            finally:
+                logger.info(f'Requests: {self.governor.summary()}')
+            return
 
         # Getting the data
+        executor = ThreadPoolExecutor(max_workers=page_workers) if page_workers > 1 else None
         try:
             for stock in tqdm(stocks, leave=False):
-                url = self.url_builder.build_url(
-                    response_format='csv',
-                    emb=emb if emb else self.url_builder.DEFAULT_EMB,
-                    params=params,
-                    sec_id=stock
-                )
+                started_at = time.perf_counter()
+                url = urls[stock]
                 logger.info(f'Url has been built: {url}')
 
-                # Get history cursor
-                _INDEX, _PAGESIZE, _TOTAL = self._get_history_cursor(stock, url)
-                start = 0
-                # cnt = 1
-                for _ in tqdm(range(_INDEX, _TOTAL, _PAGESIZE), leave=False):
-                    data = self._get_get(url + '&start=' + str(start)).text.split()[2:]
-                    handler.process_the_data(data)
-                    start += len(data)
-                logger.info(f'Data loading for {stock} is completed')
+                # Get history cursor and compute all page offsets up front
+                _INDEX, _PAGESIZE, _TOTAL = self._get_history_cursor(stock, url.cursor)
+                starts = self._page_starts(stock, _INDEX, _PAGESIZE, _TOTAL, journal)
+                page_urls = [url.page(start) for start in starts]
+                pages = executor.map(self._get_history_page, page_urls) if executor else \
+                    map(self._get_history_page, page_urls)
+                write_pages(stock, zip(starts, tqdm(pages, total=len(page_urls), leave=False)))
+                security_duration.observe(time.perf_counter() - started_at)
         except TypeError as e:
             logger.exception(e, exc_info=False)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            logger.info(f'Requests: {self.governor.summary()}')
+
+    async def _get_history_async(self, stocks: List[str], urls: Dict[str, SecurityUrl],
+                                 write_pages: Callable[[str, Iterable[Tuple[int, List[str] | ParsedPage]]], None],
+                                 concurrency: int, journal: CheckpointJournal | None = None,
+                                 executor: Executor | None = None,
+                                 parser: Callable[[List[str]], ParsedPage] | None = None,
+                                 durations: Histogram | None = None):
+        """Fetches history of the securities concurrently and passes the pages to the handler in the order of stocks.
+
+        The number of securities scheduled ahead of the one being written is limited by the concurrency,
+        so only a bounded number of downloaded securities is kept in memory.
 
-    def transfer_data_to_db(self):
+        Args:
+            stocks: list of the securities
+            urls: history urls for each security
+            write_pages: writer of the received pages of a security
+            concurrency: max number of requests in flight
+            journal: checkpoint journal of the run, the recorded pages are not requested
+            executor: process pool parsing the pages with the parser, if set
+            parser: picklable function parsing the lines of a page
+            durations: histogram of the time from scheduling a security to the end of its output
         """
+        await self._fetch_in_order_async(
+            stocks, lambda semaphore, stock: self._get_security_history_async(semaphore, stock, urls[stock], journal,
+                                                                              executor, parser),
+            write_pages, concurrency, durations)
+
+    @staticmethod
+    async def _fetch_in_order_async(items: List, fetch: Callable[[asyncio.Semaphore, Any], Awaitable],
+                                    write: Callable[[Any, Any], None], concurrency: int,
+                                    durations: Histogram | None = None):
+        """Fetches the items concurrently and writes the results in the order of the items.
+
+        At most concurrency items are scheduled ahead of the one being written, so only a bounded number
+        of downloaded results is kept in memory.
+
+        Args:
+            items: items to fetch, e.g. securities
+            fetch: coroutine function receiving the semaphore of the requests and the item
+            write: writer of the result of an item
+            concurrency: max number of requests in flight
+            durations: histogram of the time from scheduling an item to the end of its write, if set
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        item_iter = iter(items)
+        pending = deque()
+
+        def schedule():
+            item = next(item_iter, None)
+            if item is not None:
+                pending.append((item, time.perf_counter(), asyncio.create_task(fetch(semaphore, item))))
+
+        for _ in range(concurrency):
+            schedule()
+        try:
+            with tqdm(total=len(items), leave=False) as progress:
+                while pending:
+                    item, scheduled_at, task = pending.popleft()
+                    result = await task
+                    schedule()
+                    write(item, result)
+                    if durations:
+                        durations.observe(time.perf_counter() - scheduled_at)
+                    progress.update()
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    async def _get_security_history_async(self, semaphore: asyncio.Semaphore, stock: str, url: SecurityUrl,
+                                          journal: CheckpointJournal | None = None,
+                                          executor: Executor | None = None,
+                                          parser: Callable[[List[str]], ParsedPage] | None = None
+                                          ) -> List[Tuple[int, List[str] | ParsedPage]]:
+        """Fetches the history cursor of the security and then all its pages in parallel.
+        If the executor is set, each page is parsed in it as soon as it is received.
+
         Returns:
+            list: offsets and pages (or parsed pages) of the security in the order of the offsets
+        """
+        logger.info(f'Url has been built: {url}')
+        cursor = await self._get_text_async(url.cursor, semaphore)
+        _INDEX, _PAGESIZE, _TOTAL = self._parse_history_cursor(cursor)
+        logger.info(f'Total {_TOTAL} rows will be received for {stock}')
+        logger.info(f'Data loading for {stock} has started')
+        starts = self._page_starts(stock, _INDEX, _PAGESIZE, _TOTAL, journal)
 
+        async def get_page(start: int) -> Tuple[int, List[str] | ParsedPage]:
+            page = self._parse_history_page(await self._get_text_async(url.page(start), semaphore))
+            self._observe_page(page)
+            if executor:
+                page = await asyncio.get_running_loop().run_in_executor(executor, parser, page)
+            return start, page
+
+        return list(await asyncio.gather(*(get_page(start) for start in starts)))
+
+    @staticmethod
+    def _page_starts(stock: str, index: int, page_size: int, total: int,
+                     journal: CheckpointJournal | None) -> List[int]:
+        """Offsets of the pages of the security which are not recorded in the journal."""
+        return [start for start in range(index, total, page_size) if not (journal and journal.is_done(stock, start))]
+
+    async def _get_text_async(self, url: str, semaphore: asyncio.Semaphore | None = None) -> str:
+        content, encoding = await self._get_get_async(url, semaphore)
+        return content.decode(encoding or 'utf-8')
+
+    async def _get_get_async(self, url: str, semaphore: asyncio.Semaphore | None = None) -> Tuple[bytes, str]:
+        """Sends GET request to the server through the pooled session of the transport without blocking the loop.
+        Caching, rate limiting and retries are the same as in _get_get.
+
+        Args:
+            url: request url
+            semaphore: limits the number of requests in flight, if set
+
+        Returns:
+            tuple: body of the response and its encoding
+
+        Raises:
+            ISSRequestError: the request failed after all the retries
         """
-        pass
+        if self.cache:
+            cached = self.cache.get(url)
+            if cached:
+                return cached
+        if self.auth and self.auth.needs_refresh():
+            # the authentication is a blocking request, it must not stop the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.auth.ensure_auth)
+        session = self.transport.get_session(self.auth.cookies.get_dict() if self.auth else None)
+        async with semaphore or nullcontext():
+            for attempt in range(self.governor.retries + 1):
+                await self.governor.before_request_async()
+                retry_after = None
+                try:
+                    started_at = time.perf_counter()
+                    async with session.get(url) as response:
+                        self.governor.on_response(response.status)
+                        if response.status in self.governor.RETRY_STATUSES:
+                            error, retry_after = f'HTTP {response.status}', response.headers.get('Retry-After')
+                        else:
+                            response.raise_for_status()
+                            content = await response.read()
+                            encoding = response.get_encoding()
+                            self._observe_response(time.perf_counter() - started_at, len(content))
+                            break
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    error = repr(e)
+                except aiohttp.ClientError as e:
+                    self.governor.on_failure()
+                    self._count_failure()
+                    raise ISSRequestError(f'Request to {url} failed: {e}') from e
+                if attempt < self.governor.retries:
+                    delay = self.governor.backoff(attempt, retry_after)
+                    self.governor.on_retry(delay)
+                    self.metrics.counter('iss_retries_total', 'Retried ISS requests').inc()
+                    logger.warning(f'Retry {attempt + 1} of {url} in {delay:.2f} s: {error}')
+                    await asyncio.sleep(delay)
+            else:
+                self.governor.on_failure()
+                self._count_failure()
+                raise ISSRequestError(f'Request to {url} failed after {self.governor.retries} retries: {error}')
+        if self.cache:
+            self.cache.set(url, content, encoding)
+        return content, encoding
+
+    def _run_async(self, coroutine):
+        """Runs the coroutine in a new event loop from the sync methods and closes the session of the transport.
+
+        If the calling thread already runs an event loop (e.g. Jupyter), the new loop is run in a worker thread
+        and the sync method blocks until it completes.
+        """
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await self.transport.close()
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(run())
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='iss-loop') as executor:
+            return executor.submit(asyncio.run, run()).result()
+
+    def _get_parse_executor(self, parse_workers: int) -> ProcessPoolExecutor:
+        """Returns the process pool of the page parsers kept between the calls, recreated if the size differs."""
+        if self._parse_executor is None or self._parse_executor._max_workers != parse_workers:
+            self.shutdown()
+            # spawn: the workers must not inherit the threads and the open files of the client
+            self._parse_executor = ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._parse_executor
+
+    def shutdown(self):
+        """Stops the worker processes of the page parsers started by the parse_workers mode."""
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(cancel_futures=True)
+            self._parse_executor = None
+
+    async def aclose(self):
+        """Closes the pooled session of the async methods and stops the page parsers."""
+        await self.transport.close()
+        self.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    @staticmethod
+    def _parse_history_cursor(text: str) -> Tuple[int, int, int]:
+        """Parses INDEX, PAGESIZE and TOTAL out of the csv history cursor with metadata turned off."""
+        _INDEX, _TOTAL, _PAGESIZE = map(int, text.split()[1].split(';')[:3])
+        return _INDEX, _PAGESIZE, _TOTAL
+
+    @staticmethod
+    def _parse_history_page(text: str) -> List[str]:
+        """Drops the block name and the column names of the csv history page."""
+        return text.split()[2:]
+
+    def _get_history_page(self, url: str) -> List[str]:
+        return self._observe_page(self._parse_history_page(self._get_get(url).text))
+
+    def _count_failure(self):
+        self.metrics.counter('iss_failures_total', 'ISS requests failed after all the retries').inc()
+
+    def _observe_page(self, page: List[str]) -> List[str]:
+        self.metrics.histogram('iss_page_rows', 'Rows of the pages', ROWS_BUCKETS).observe(len(page))
+        return page
+
+    def _observe_response(self, seconds: float, size: int | None):
+        self.metrics.histogram('iss_request_duration_seconds', 'Latency of the ISS requests').observe(seconds)
+        if size is not None:
+            self.metrics.histogram('iss_response_size_bytes', 'Size of the ISS responses',
+                                   BYTES_BUCKETS).observe(size)
 
+    @timer
+    def transfer_data_to_db(self, pg_client,
+                            table_name: str = 'moex_history',
+                            emb: Dict[str, str] = None,
+                            primary_board: bool = False,
+                            list_level: int = None,
+                            sec_ids: Set[str] = None,
+                            date_interval: str = None,
+                            concurrency: int | None = None,
+                            page_workers: int = 1,
+                            watermarks: WatermarkStore | None = None):
+        """Get historical data and load it into a Postgres table with COPY
+
+        Rows are deduplicated on (SECID, BOARDID, TRADEDATE): existing rows are updated with the received values.
+
+        Args:
+            pg_client: PostgresClient of the target database
+            table_name: target table, created if it does not exist
+            See get_history_csv for the description of the other arguments.
+        """
+        self._check_execution_args(concurrency, page_workers)
+        handler = self.handlers['sql']
+        handler.container.set_connection(pg_client, table_name)
+        with handler:
+            self._get_history(handler, emb, primary_board, list_level, sec_ids, date_interval,
+                              concurrency, page_workers, watermarks)
+        if watermarks:
+            watermarks.save()
+
+    @timer
     def get_history_df(self, emb: Dict[str, str] = None,
                        primary_board: bool = False,
                        list_level: int = None,
                        sec_ids: Set[str] = None,
-                       date_interval: str = None):
+                       date_interval: str = None,
+                       concurrency: int | None = None,
+                       page_workers: int = 1,
+                       watermarks: WatermarkStore | None = None,
+                       parse_workers: int | None = None):
         """Retrieves historical data and converts it to pandas.DataFrame format
         Args:
-            emb:
-            primary_board:
-            list_level:
-            sec_ids:
-            date_interval:
+            emb: values for engines, markets, boards. Defaults to stock/shares
+            primary_board: receive data only for the primary board of the security
+            list_level: listing level of the securities, from 1 to 3
+            sec_ids: names of the securities
+            date_interval: 'from till' dates separated by a space
+            parse_workers: number of processes splitting the pages into columns, the typed frame is built once
+                on close. Requires the concurrency, see get_history_parquet
+            See get_history_csv for the description of the other arguments.
+
+        Returns: pandas.DataFrame object with categorical SECID and BOARDID, datetime TRADEDATE and numeric values
+        """
+        self._check_execution_args(concurrency, page_workers, parse_workers)
+        handler = self.handlers['df']
+        with handler:
+            self._get_history(handler, emb, primary_board, list_level, sec_ids, date_interval,
+                              concurrency, page_workers, watermarks, parse_workers=parse_workers)
+        if watermarks:
+            watermarks.save()
+        return handler.container.df
+
+    @timer
+    def get_candles_csv(self, sec_ids: Set[str] = None,
+                        date_interval: str = None,
+                        interval: int = 1,
+                        emb: Dict[str, str] = None,
+                        list_level: int = None,
+                        filepath: str = None,
+                        concurrency: int = 4,
+                        chunk_days: int | None = None):
+        """Get intraday candles and write them to a csv file
 
-        Returns: pandas.DataFrame object
+        The date interval is split into chunks of chunk_days, the chunks are fetched concurrently and written
+        in chronological order for each security as soon as they are received. Candles repeated at the boundaries
+        of the chunks are written once.
+
+        Args:
+            sec_ids: names of the securities
+            date_interval: 'from till' dates separated by a space
+            interval: candle interval: 1 - minute, 10 - 10 minutes, 60 - hour, 24 - day
+            emb: values for engines, markets, boards. Defaults to stock/shares
+            list_level: listing level of the securities, from 1 to 3
+            filepath: output file path
+            concurrency: max number of requests in flight
+            chunk_days: length of the date range of a request, days. Defaults to CANDLE_CHUNK_DAYS of the interval
         """
-        pass
+        chunks = self._get_candle_chunks(date_interval, interval, concurrency, chunk_days)
+        handler = self.handlers['csv']
+        handler.container.set_filepath(filepath=filepath)
+        with handler:
+            self._get_candles(handler, emb, list_level, sec_ids, chunks, interval, concurrency)
+
+    @timer
+    def get_candles_parquet(self, sec_ids: Set[str] = None,
+                            date_interval: str = None,
+                            interval: int = 1,
+                            emb: Dict[str, str] = None,
+                            list_level: int = None,
+                            filepath: str = None,
+                            compression: str = 'zstd',
+                            row_group_size: int = 128 * 1024,
+                            concurrency: int = 4,
+                            chunk_days: int | None = None):
+        """Get intraday candles with typed columns and write them to a parquet file
+
+        Args:
+            compression: parquet compression codec
+            row_group_size: max number of rows in a row group
+            See get_candles_csv for the description of the other arguments.
+        """
+        chunks = self._get_candle_chunks(date_interval, interval, concurrency, chunk_days)
+        handler = self.handlers['parquet']
+        handler.container.set_filepath(filepath=filepath, compression=compression, row_group_size=row_group_size)
+        with handler:
+            self._get_candles(handler, emb, list_level, sec_ids, chunks, interval, concurrency)
+
+    @timer
+    def transfer_candles_to_db(self, pg_client,
+                               table_name: str = 'moex_candles',
+                               sec_ids: Set[str] = None,
+                               date_interval: str = None,
+                               interval: int = 1,
+                               emb: Dict[str, str] = None,
+                               list_level: int = None,
+                               concurrency: int = 4,
+                               chunk_days: int | None = None):
+        """Get intraday candles and load them into a Postgres table with COPY
+
+        Rows are deduplicated on (SECID, BEGIN): existing rows are updated with the received values.
+
+        Args:
+            pg_client: PostgresClient of the target database
+            table_name: target table, created if it does not exist
+            See get_candles_csv for the description of the other arguments.
+        """
+        chunks = self._get_candle_chunks(date_interval, interval, concurrency, chunk_days)
+        handler = self.handlers['sql']
+        handler.container.set_connection(pg_client, table_name, key_columns=('SECID', 'BEGIN'))
+        with handler:
+            self._get_candles(handler, emb, list_level, sec_ids, chunks, interval, concurrency)
+
+    @timer
+    def get_candles_df(self, sec_ids: Set[str] = None,
+                       date_interval: str = None,
+                       interval: int = 1,
+                       emb: Dict[str, str] = None,
+                       list_level: int = None,
+                       concurrency: int = 4,
+                       chunk_days: int | None = None):
+        """Get intraday candles in pandas.DataFrame format
+        See get_candles_csv for the description of the arguments.
+
+        Returns: pandas.DataFrame object with categorical SECID, datetime BEGIN and END and numeric values
+        """
+        chunks = self._get_candle_chunks(date_interval, interval, concurrency, chunk_days)
+        handler = self.handlers['df']
+        with handler:
+            self._get_candles(handler, emb, list_level, sec_ids, chunks, interval, concurrency)
+        return handler.container.df
+
+    def _get_candle_chunks(self, date_interval: str | None, interval: int, concurrency: int,
+                           chunk_days: int | None) -> List[Tuple[str, str]]:
+        """Validates the arguments and splits the date interval into the date ranges of the requests.
+
+        Neighbouring chunks share the boundary date, the candles received twice are dropped on writing.
+        """
+        self._check_execution_args(concurrency, 1)
+        if interval not in self.CANDLE_CHUNK_DAYS:
+            raise InvalidArgs(f'The candle interval should be one of {list(self.CANDLE_CHUNK_DAYS)}.')
+        if chunk_days is not None and (not isinstance(chunk_days, int) or chunk_days < 1):
+            raise InvalidArgs('The number of days of a chunk should be a positive integer.')
+        try:
+            first, last = map(date.fromisoformat, date_interval.split())
+        except (AttributeError, ValueError):
+            raise InvalidArgs("The date interval should be 'from till' dates in the YYYY-MM-DD format.")
+        step = timedelta(days=chunk_days if chunk_days else self.CANDLE_CHUNK_DAYS[interval])
+        chunks = []
+        while True:
+            till = min(first + step, last)
+            chunks.append((first.isoformat(), till.isoformat()))
+            if till >= last:
+                return chunks
+            first = till
+
+    def _get_candles(self, handler: MicexISSDataHandler,
+                     emb: Dict[str, str] | None,
+                     list_level: int | None,
+                     sec_ids: Set[str] | None,
+                     chunks: List[Tuple[str, str]],
+                     interval: int,
+                     concurrency: int):
+        """Receives candles of the securities chunk by chunk and passes them to the opened handler.
+        See get_candles_csv for the description of the arguments.
+        """
+        stocks = self._get_list_of_stocks(list_level, sec_ids)
+        logger.info(f'Candles will be received for the following stocks: {stocks}')
+        handler.process_the_header(['SECID', *self.CANDLE_COLUMNS])
+
+        emb = emb if emb else self.url_builder.DEFAULT_EMB
+        params = {'iss.only': 'candles', 'candles.columns': ','.join(self.CANDLE_COLUMNS).lower(),
+                  'interval': interval}
+        prepared_url = self.url_builder.prepare(response_format='csv', namespace='trading_system', emb=emb,
+                                                params=params, resource='candles')
+        jobs = [(stock, prepared_url.for_security(stock, **{'from': from_date, 'till': till_date}))
+                for stock in stocks for from_date, till_date in chunks]
+        last_begin = dict()
+
+        def write_chunk(job: Tuple[str, SecurityUrl], lines: List[str]):
+            stock = job[0]
+            # Lines are sorted by BEGIN, the candles of the shared boundary date are at the head of the chunk
+            skip = 0
+            while skip < len(lines) and lines[skip].split(';', 1)[0] <= last_begin.get(stock, ''):
+                skip += 1
+            if skip < len(lines):
+                handler.process_the_data([f'{stock};{line}' for line in lines[skip:]])
+                last_begin[stock] = lines[-1].split(';', 1)[0]
+
+        try:
+            self._run_async(self._fetch_in_order_async(
+                jobs, lambda semaphore, job: self._get_candle_chunk_async(semaphore, job[1]), write_chunk,
+                concurrency))
+        finally:
+            logger.info(f'Requests: {self.governor.summary()}')
+
+    async def _get_candle_chunk_async(self, semaphore: asyncio.Semaphore, url: SecurityUrl) -> List[str]:
+        """Fetches all the pages of the candles of a chunk one after another.
+
+        Returns:
+            list: ';'-separated candles of the chunk
+        """
+        lines = []
+        while True:
+            page = self._observe_page(self._parse_candles_page(await self._get_text_async(url.page(len(lines)),
+                                                                                          semaphore)))
+            lines += page
+            if len(page) < self.CANDLES_PAGE_SIZE:
+                return lines
+
+    @staticmethod
+    def _parse_candles_page(text: str) -> List[str]:
+        """Drops the block name and the column names of the csv candles page. Candle times contain spaces,
+        so the page is split by lines, the blank line after the block name is dropped before them."""
+        return [line for line in text.splitlines() if line][2:]
 
     def get_moex_news(self):
         """Receives news from ISS and places it in the database"""
         pass
 
-    def _get_get(self, url: str) -> Response:
-        """
+    def _get_get(self, url: str, stream: bool = False) -> Response:
+        """Sends GET request to the server. If the client has a cache, the cached response is returned when valid.
+
+        Requests are rate limited by the governor of the client. Responses with 429 and 5xx statuses, timeouts
+        and connection errors are retried with exponential backoff, other error statuses are not retried.
 
         Args:
-            url:
+            url: request url
+            stream: do not download the body immediately, so it can be read with Response.iter_content
 
         Returns:
+            Response: server response
 
+        Raises:
+            ISSRequestError: the request failed after all the retries or with a status which is not retried
         """
-        try:
-            return self.auth.session.get(url) if self.auth else requests.get(url)
-        except requests.ConnectionError as e:
-            logger.exception(e, exc_info=False)
-        except requests.Timeout as e:
-            logger.exception(e)
-        except requests.RequestException as e:
-            logger.exception(e)
-
-    def _get_history_cursor(self, stock: str, url: str) -> Tuple[int, int, int]:
-        _INDEX = int(self._get_get(
-            url.replace('iss.only=history', 'iss.only=history.cursor&iss.meta=off')).text.split()[1].split(';')[0])
-        _TOTAL = int(self._get_get(
-            url.replace('iss.only=history', 'iss.only=history.cursor&iss.meta=off')).text.split()[1].split(';')[1])
-        _PAGESIZE = int(self._get_get(
-            url.replace('iss.only=history', 'iss.only=history.cursor&iss.meta=off')).text.split()[1].split(';')[2])
+        if self.cache:
+            cached = self.cache.get(url)
+            if cached:
+                response = Response()
+                response.status_code = 200
+                response.url = url
+                response._content, response.encoding = cached
+                response._content_consumed = True
+                return response
+        if self.auth:
+            self.auth.ensure_auth()
+        get = self.auth.session.get if self.auth else requests.get
+        for attempt in range(self.governor.retries + 1):
+            self.governor.before_request()
+            retry_after = None
+            try:
+                started_at = time.perf_counter()
+                response = get(url, timeout=self.governor.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = repr(e)
+            except requests.RequestException as e:
+                self.governor.on_failure()
+                self._count_failure()
+                raise ISSRequestError(f'Request to {url} failed: {e}') from e
+            else:
+                self.governor.on_response(response.status_code)
+                if response.status_code not in self.governor.RETRY_STATUSES:
+                    if not 200 <= response.status_code < 300:
+                        # the error page must not reach the handlers as data
+                        response.close()
+                        self.governor.on_failure()
+                        self._count_failure()
+                        raise ISSRequestError(f'Request to {url} failed: HTTP {response.status_code}')
+                    # the body of a streamed response is read later by the caller
+                    self._observe_response(time.perf_counter() - started_at, None if stream else len(response.content))
+                    if self.cache and response.status_code == 200:
+                        self.cache.set(url, response.content, response.encoding)
+                    return response
+                error, retry_after = f'HTTP {response.status_code}', response.headers.get('Retry-After')
+            if attempt < self.governor.retries:
+                delay = self.governor.backoff(attempt, retry_after)
+                self.governor.on_retry(delay)
+                self.metrics.counter('iss_retries_total', 'Retried ISS requests').inc()
+                logger.warning(f'Retry {attempt + 1} of {url} in {delay:.2f} s: {error}')
+                time.sleep(delay)
+        self.governor.on_failure()
+        self._count_failure()
+        raise ISSRequestError(f'Request to {url} failed after {self.governor.retries} retries: {error}')
+
+    def _get_history_cursor(self, stock: str, cursor_url: str) -> Tuple[int, int, int]:
+        """Reads INDEX, TOTAL and PAGESIZE of the security history with a single cursor request."""
+        _INDEX, _PAGESIZE, _TOTAL = self._parse_history_cursor(self._get_get(cursor_url).text)
         logger.info(f'Total {_TOTAL} rows will be received for {stock}')
         logger.info(f'Data loading for {stock} has started')
         return _INDEX, _PAGESIZE, _TOTAL
@@ -359,24 +1224,26 @@ class MicexISSClient:
         try:
             if list_level or sec_ids:
                 if sec_ids:
+                    universe = self.get_securities_universe()
                     sec_ids = set(map(lambda el: el.upper(), sec_ids))
-                    stocks = [el[0] for el in self.get_stock_exchange_list() if el[0] in sec_ids]
+                    stocks = [sec_id for sec_id in sec_ids if sec_id in universe.by_secid]
                     if len(stocks) == 0 and list_level:
                         if isinstance(list_level, int) and list_level in range(1, 4):
-                            stocks = [el[0] for el in self.get_stock_exchange_list() if el[4] == list_level]
+                            stocks = list(universe.by_level.get(list_level, []))
                         else:
                             raise InvalidArgs('Invalid both arguments: sec_ids and list_level')
                     elif len(stocks) == 0 and not list_level:
                         raise InvalidArgs('No securities found.')
                 else:
                     if isinstance(list_level, int) and list_level in range(1, 4):
-                        stocks = [el[0] for el in self.get_stock_exchange_list() if el[4] == list_level]
+                        stocks = list(self.get_securities_universe().by_level.get(list_level, []))
                     else:
                         raise InvalidArgs('The list level should be an integer from 1 to 3.')
             else:
-                stocks = [el[0] for el in self.get_stock_exchange_list()]
-            return stocks
-        except TypeError as e:
+                stocks = list(self.get_securities_universe().by_secid)
+            # the order must not depend on the hash seed: a resumed run continues the same sequence
+            return sorted(stocks)
+        except (TypeError, AttributeError) as e:
             logger.exception(e, exc_info=False)
 
     async def get_candles_for_dashboard(
@@ -387,6 +1254,7 @@ class MicexISSClient:
         """Получаем свечные данные в формате для Lightweight Charts"""
         params = {
             'iss.only': 'history',
+            'iss.meta': 'off',
             'history.columns': 'TRADEDATE,OPEN,LOW,HIGH,CLOSE',
             'limit': days
         }
@@ -398,17 +1266,112 @@ class MicexISSClient:
             params=params
         )
 
-        response = self._get_get(url)
-        data = response.json()['history']['data']
+        content, _ = await self._get_get_async(url)
+        data = read_block([content], 'history',
+                          ('TRADEDATE', 'OPEN', 'LOW', 'HIGH', 'CLOSE'), (str, float, float, float, float))
 
         return [{
             "time": item[0],  # TRADEDATE
-            "open": float(item[1]),
-            "low": float(item[2]),
-            "high": float(item[3]),
-            "close": float(item[4])
+            "open": item[1],
+            "low": item[2],
+            "high": item[3],
+            "close": item[4]
         } for item in reversed(data)]  # Разворачиваем для хронологического порядка
 
+    async def get_candles_batch(
+            self,
+            tickers: Iterable[str] | None = None,
+            index: str | None = None,
+            days: int = 30,
+            emb: Dict[str, str] | None = None,
+            concurrency: int = 10
+    ) -> Dict[str, Dict[str, List]]:
+        """Get daily candles of several tickers or of the whole index composition concurrently
+
+        Args:
+            tickers: names of the securities
+            index: index id, e.g. IMOEX. Its current constituents are added to the tickers
+            days: number of the last trading days
+            emb: values for engines, markets, boards. Defaults to the TQBR board of the shares market
+            concurrency: max number of requests in flight
+
+        Returns:
+            dict: column arrays time, open, low, high, close and volume in chronological order for each ticker.
+                Tickers which could not be received are logged and skipped
+        """
+        self._check_execution_args(concurrency, 1)
+        tickers = [ticker.upper() for ticker in tickers] if tickers else []
+        if index:
+            tickers += [ticker for ticker in await self.get_index_composition(index) if ticker not in tickers]
+        if not tickers:
+            raise InvalidArgs('Tickers or index should be provided.')
+        emb = emb if emb else {**self.url_builder.DEFAULT_EMB, 'boards': 'TQBR'}
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(self._get_candles_columns(ticker, days, emb, semaphore) for ticker in tickers),
+                                       return_exceptions=True)
+        candles = dict()
+        for ticker, result in zip(tickers, results):
+            if isinstance(result, Exception):
+                logger.warning(f'Candles for {ticker} were not received: {result}')
+            else:
+                candles[ticker] = result
+        return candles
+
+    async def get_index_composition(self, index: str = 'IMOEX') -> List[str]:
+        """Get current constituents of the index
+
+        Args:
+            index: index id
+
+        Returns:
+            list: SECIDs of the constituents
+        """
+        tickers = []
+        start = 0
+        while True:
+            url = self.url_builder.build_url(
+                namespace='statistics',
+                emb={'engines': 'stock', 'markets': 'index'},
+                collection='analytics',
+                sec_id=index,
+                params={'iss.only': 'analytics', 'iss.meta': 'off', 'analytics.columns': 'secids',
+                        'limit': 100, 'start': start}
+            )
+            content, _ = await self._get_get_async(url)
+            page = [row[0] for row in read_block([content], 'analytics', ('secids',))]
+            tickers += page
+            if len(page) < 100:
+                return tickers
+            start += len(page)
+
+    async def _get_candles_columns(self, ticker: str, days: int, emb: Dict[str, str],
+                                   semaphore: asyncio.Semaphore) -> Dict[str, List]:
+        """Fetches the last days of the ticker history newest first, page by page, and returns column arrays"""
+        names = ('time', 'open', 'low', 'high', 'close', 'volume')
+        columns = {name: [] for name in names}
+        start = 0
+        while start < days:
+            limit = min(100, days - start)
+            url = self.url_builder.build_url(
+                emb=emb,
+                sec_id=ticker,
+                params={'iss.only': 'history', 'iss.meta': 'off',
+                        'history.columns': 'TRADEDATE,OPEN,LOW,HIGH,CLOSE,VOLUME',
+                        'sort_order': 'desc', 'limit': limit, 'start': start}
+            )
+            content, _ = await self._get_get_async(url, semaphore)
+            page = read_block_columns([content], 'history', ('TRADEDATE', 'OPEN', 'LOW', 'HIGH', 'CLOSE', 'VOLUME'),
+                                      (str, _float_or_none, _float_or_none, _float_or_none, _float_or_none,
+                                       _float_or_none))
+            for name, values in zip(names, page.values()):
+                columns[name].extend(values)
+            if len(page['TRADEDATE']) < limit:
+                break
+            start += limit
+        for values in columns.values():
+            values.reverse()
+        return columns
+
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,148 @@
+"""Streaming decoder of the ISS json blocks.
+
+ISS json responses consist of blocks like
+
+    {"securities": {"columns": ["SECID", "BOARDID", ...], "data": [["SBER", "TQBR", ...], ...]}}
+
+The decoder reads the response body chunk by chunk and decodes the rows of the "data" list one at a time,
+keeping only the requested columns. The whole body and the list of all the rows are never held in memory.
+The "columns" list of the block is expected before its "data" list, as ISS sends them.
+"""
+import codecs
+import json
+import re
+
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+_WHITESPACE = ' \t\n\r'
+
+
+class ISSBlockDecoder:
+    """ Incremental decoder of the rows of a single ISS json block.
+    """
+
+    def __init__(self, block: str, columns: Sequence[str],
+                 converters: Union[Sequence[Callable[[Any], Any]], None] = None):
+        """
+        Args:
+            block: name of the block, e.g. securities or history
+            columns: names of the columns to keep, in the order of the resulting tuples
+            converters: optional functions applied to the values of the columns
+        """
+        self.block = block
+        self.columns = list(columns)
+        self.converters = list(converters) if converters else None
+        self.indexes: List[int] = []
+        self.done = False
+        self._state = 'block'
+        self._buffer = ''
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._patterns = {
+            'block': re.compile(r'"%s"\s*:\s*\{' % re.escape(block)),
+            'columns': re.compile(r'"columns"\s*:\s*'),
+            'data': re.compile(r'"data"\s*:\s*\['),
+        }
+
+    def feed(self, chunk: Union[str, bytes]) -> List[Tuple]:
+        """Adds a chunk of the response body and returns the rows completed by it."""
+        if isinstance(chunk, bytes):
+            chunk = self._text_decoder.decode(chunk)
+        if self.done or not chunk:
+            return []
+        self._buffer += chunk
+        rows = []
+        pos = 0
+        while not self.done:
+            if self._state == 'rows':
+                pos, complete = self._decode_rows(pos, rows)
+                if not complete:
+                    break
+            else:
+                match = self._patterns[self._state].search(self._buffer, pos)
+                if match is None:
+                    # keep the tail which can contain the beginning of the key
+                    pos = max(pos, len(self._buffer) - 32)
+                    break
+                pos = match.end()
+                if self._state == 'block':
+                    self._state = 'columns'
+                elif self._state == 'columns':
+                    try:
+                        names, pos = self._decoder.raw_decode(self._buffer, pos)
+                    except json.JSONDecodeError:
+                        pos = match.start()
+                        break
+                    missing = [column for column in self.columns if column not in names]
+                    if missing:
+                        raise KeyError(f'Columns {missing} are not found in the {self.block} block')
+                    self.indexes = [names.index(column) for column in self.columns]
+                    self._state = 'data'
+                else:
+                    self._state = 'rows'
+        self._buffer = self._buffer[pos:]
+        return rows
+
+    def close(self):
+        """Checks that the block was decoded completely."""
+        if not self.done:
+            raise ValueError(f'The {self.block} block of the ISS response is incomplete')
+
+    def _decode_rows(self, pos: int, rows: List[Tuple]) -> Tuple[int, bool]:
+        buffer = self._buffer
+        indexes = self.indexes
+        converters = self.converters
+        while True:
+            while pos < len(buffer) and (buffer[pos] in _WHITESPACE or buffer[pos] == ','):
+                pos += 1
+            if pos == len(buffer):
+                return pos, False
+            if buffer[pos] == ']':
+                self.done = True
+                return pos + 1, True
+            try:
+                row, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                return pos, False
+            pos = end
+            if converters:
+                rows.append(tuple(convert(row[i]) for convert, i in zip(converters, indexes)))
+            else:
+                rows.append(tuple(row[i] for i in indexes))
+
+
+def read_block(chunks: Iterable[Union[str, bytes]], block: str, columns: Sequence[str],
+               converters: Union[Sequence[Callable[[Any], Any]], None] = None) -> List[Tuple]:
+    """Decodes the rows of the block from the chunks of the response body.
+
+    Returns:
+        list: tuples with the values of the requested columns
+    """
+    decoder = ISSBlockDecoder(block, columns, converters)
+    rows = []
+    for chunk in chunks:
+        rows.extend(decoder.feed(chunk))
+        if decoder.done:
+            break
+    decoder.close()
+    return rows
+
+
+def read_block_columns(chunks: Iterable[Union[str, bytes]], block: str, columns: Sequence[str],
+                       converters: Union[Sequence[Callable[[Any], Any]], None] = None) -> Dict[str, List]:
+    """Decodes the block from the chunks of the response body into column arrays.
+
+    Returns:
+        dict: list of values for each requested column
+    """
+    decoder = ISSBlockDecoder(block, columns, converters)
+    arrays = {column: [] for column in columns}
+    for chunk in chunks:
+        rows = decoder.feed(chunk)
+        if rows:
+            for array, values in zip(arrays.values(), zip(*rows)):
+                array.extend(values)
+        if decoder.done:
+            break
+    decoder.close()
+    return arrays
@@ -0,0 +1,168 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800, 3600)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+ROWS_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """ Monotonic counter.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0):
+        with self._lock:
+            self.value += value
+
+
+class Histogram:
+    """ Histogram with fixed upper bounds of the buckets, as in Prometheus.
+
+    Keeps the number of observations in each bucket, their count, sum, min and max. Quantiles are estimated
+    by linear interpolation within the bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = SECONDS_BUCKETS):
+        """
+        Args:
+            buckets: sorted upper bounds of the buckets. The +Inf bucket is added
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observes the duration of the block, seconds."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time)
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile of the observations."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else min(self.min, self.buckets[0])
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count, 'min': self.min,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99), 'max': self.max}
+
+
+class MetricsRegistry:
+    """ Registry of the counters and histograms of the ISS client.
+
+    Metrics are identified by name and labels and created on the first use. The registry can be exported
+    as Prometheus text exposition format or as a json summary, e.g. at the end of a nightly run.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Dict[Labels, Union[Counter, Histogram]]] = dict()
+        self._help: Dict[str, str] = dict()
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = '', **labels: str) -> Counter:
+        return self._get(name, help, labels, Counter)
+
+    def histogram(self, name: str, help: str = '', buckets: Sequence[float] = SECONDS_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get(name, help, labels, lambda: Histogram(buckets))
+
+    def _get(self, name: str, help: str, labels: Dict[str, str], factory):
+        key = tuple(sorted(labels.items()))
+        metrics = self._metrics.get(name)
+        if metrics is None or key not in metrics:
+            with self._lock:
+                metrics = self._metrics.setdefault(name, dict())
+                if key not in metrics:
+                    metrics[key] = factory()
+                if help:
+                    self._help.setdefault(name, help)
+        return metrics[key]
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for name, metrics in sorted(self._metrics.items()):
+            metric_type = 'counter' if isinstance(next(iter(metrics.values())), Counter) else 'histogram'
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, metric in sorted(metrics.items()):
+                if isinstance(metric, Counter):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(metric.value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), metric.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else _format_value(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(metric.sum)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict[str, Dict[str, Union[float, Dict[str, float]]]]:
+        """Returns the values of the counters and the summaries of the histograms by name and labels."""
+        return {name: {_format_labels(labels): metric.value if isinstance(metric, Counter) else metric.summary()
+                       for labels, metric in sorted(metrics.items())}
+                for name, metrics in sorted(self._metrics.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=1)
+
+    def dump(self, filepath: str):
+        """Writes the metrics to the file: Prometheus text for the .prom extension, json summary otherwise."""
+        with open(filepath, 'w') as file:
+            file.write(self.to_prometheus() if filepath.endswith('.prom') else self.to_json())
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
@@ -0,0 +1,131 @@
+import asyncio
+import random
+import threading
+import time
+
+from typing import Dict, Union
+
+
+class TokenBucket:
+    """ Token bucket shared by the threads and the tasks of the client.
+
+    The rate is adaptive: it is halved when the server throttles the client and restored
+    step by step after successful responses, but never exceeds the configured max rate.
+    """
+
+    def __init__(self, rate: float, capacity: Union[float, None] = None, min_rate: float = 1.0):
+        """
+        Args:
+            rate: max number of requests per second
+            capacity: max number of requests in a burst. Defaults to the rate
+            min_rate: the rate is never decreased below this value
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity if capacity else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the time to wait before the request can be sent, seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def decrease(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def increase(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RequestGovernor:
+    """ Rate limiter and retry policy for the requests to the ISS server.
+
+    Every request takes a token from the bucket. Responses with the 429 and 5xx statuses, timeouts
+    and connection errors are retried with exponential backoff with full jitter; the Retry-After
+    header of the server is respected. Counts and durations of the waits and retries are collected in stats.
+    """
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    THROTTLE_STATUSES = frozenset({429, 503})
+
+    def __init__(self, rate: float = 50.0, burst: Union[float, None] = None, retries: int = 5,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0, timeout: float = 30.0):
+        """
+        Args:
+            rate: max number of requests per second
+            burst: max number of requests in a burst. Defaults to the rate
+            retries: max number of retries of a request
+            backoff_base: backoff of the first retry, seconds
+            backoff_cap: max backoff, seconds
+            timeout: timeout of a request, seconds
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.stats: Dict[str, float] = {'requests': 0, 'waits': 0, 'wait_time': 0.0, 'retries': 0,
+                                        'backoff_time': 0.0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, retry_after: Union[str, None] = None) -> float:
+        """Returns the delay before the retry number attempt (starting from 0), seconds."""
+        if retry_after:
+            try:
+                return min(self.backoff_cap, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def before_request(self) -> float:
+        """Blocks until the request can be sent."""
+        return self._count_wait(self.bucket.acquire())
+
+    async def before_request_async(self) -> float:
+        return self._count_wait(await self.bucket.acquire_async())
+
+    def on_response(self, status: int):
+        if status in self.THROTTLE_STATUSES:
+            self.bucket.decrease()
+        elif status < 400:
+            self.bucket.increase()
+
+    def on_retry(self, delay: float):
+        self._add(retries=1, backoff_time=delay)
+
+    def on_failure(self):
+        self._add(failures=1)
+
+    def summary(self) -> str:
+        return ', '.join(f'{name}: {round(value, 3)}' for name, value in self.stats.items()) + \
+            f', rate: {round(self.bucket.rate, 3)}'
+
+    def _count_wait(self, wait: float) -> float:
+        self._add(requests=1, waits=1 if wait else 0, wait_time=wait)
+        return wait
+
+    def _add(self, **values: float):
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
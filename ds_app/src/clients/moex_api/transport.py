@@ -0,0 +1,56 @@
+import asyncio
+
+import aiohttp
+
+from typing import Dict, Union
+
+
+class AsyncISSTransport:
+    """ Long-lived aiohttp session shared by the async methods of the ISS client.
+
+    The session keeps connections alive, caches DNS lookups and limits the number of connections
+    per host. It is created lazily in the running event loop and recreated if the client is used
+    from another loop (e.g. after asyncio.run has finished).
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, timeout: float = 30.0):
+        """
+        Args:
+            limit: max number of connections of the session
+            limit_per_host: max number of connections to the same host
+            dns_cache_ttl: time to live of the cached DNS lookups, seconds
+            keepalive_timeout: time to keep idle connections open, seconds
+            timeout: total timeout of a request, seconds
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Union[aiohttp.ClientSession, None] = None
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+
+    def get_session(self, cookies: Union[Dict[str, str], None] = None) -> aiohttp.ClientSession:
+        """Returns the session of the running event loop, creating it if needed.
+
+        Args:
+            cookies: cookies of the session, e.g. the MOEX passport certificate
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_cache_ttl,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, cookies=cookies,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+        elif cookies:
+            self._session.cookie_jar.update_cookies(cookies)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
@@ -0,0 +1,50 @@
+import json
+import os
+from datetime import date, timedelta
+
+from typing import Dict, Union
+
+
+class WatermarkStore:
+    """ Persistent store of the last received TRADEDATE for each (engine, market, board, SECID).
+
+    Used by the ISS client for incremental history sync: the next run requests data only from the day
+    after the watermark. The store is kept in a json file which is rewritten atomically on save.
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Args:
+            filepath: path to the json file with watermarks. Created on the first save
+        """
+        self.filepath = filepath
+        self._watermarks: Dict[str, str] = dict()
+        if os.path.exists(self.filepath):
+            with open(self.filepath) as file:
+                self._watermarks = json.load(file)
+
+    @staticmethod
+    def key(emb: Dict[str, str], sec_id: str) -> str:
+        return '/'.join((emb.get('engines', ''), emb.get('markets', ''), emb.get('boards', ''), sec_id.upper()))
+
+    def get(self, emb: Dict[str, str], sec_id: str) -> Union[date, None]:
+        """Returns the last received trade date of the security or None if it was never loaded."""
+        watermark = self._watermarks.get(self.key(emb, sec_id))
+        return date.fromisoformat(watermark) if watermark else None
+
+    def next_date(self, emb: Dict[str, str], sec_id: str) -> Union[str, None]:
+        """Returns the first trade date which has to be requested for the security."""
+        watermark = self.get(emb, sec_id)
+        return (watermark + timedelta(days=1)).isoformat() if watermark else None
+
+    def update(self, emb: Dict[str, str], sec_id: str, trade_date: str):
+        """Moves the watermark of the security forward. Earlier dates are ignored."""
+        key = self.key(emb, sec_id)
+        if trade_date > self._watermarks.get(key, ''):
+            self._watermarks[key] = trade_date
+
+    def save(self):
+        tmp_filepath = f'{self.filepath}.tmp'
+        with open(tmp_filepath, 'w') as file:
+            json.dump(self._watermarks, file, indent=1, sort_keys=True)
+        os.replace(tmp_filepath, self.filepath)
@@ -5,3 +5,9 @@ class InvalidArgs(ValueError):
     def __init__(self, message="Invalid list level provided."):
         self.message = message
         super().__init__(self.message)
+
+
+class ISSRequestError(ConnectionError):
+    def __init__(self, message="Request to the ISS server failed."):
+        self.message = message
+        super().__init__(self.message)
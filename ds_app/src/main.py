@@ -34,8 +34,8 @@ async def main():
     if not pg_client.check_connection():
         raise ConnectionError("Не удалось подключиться к PostgreSQL")
 
-    # Запуск ETL процесса
-    etl = S3ToPostgresETL(s3_client, pg_client, table_name, need_spec_check=False)
+    # Запуск ETL процесса, файлы, не изменившиеся с последней загрузки, пропускаются
+    etl = S3ToPostgresETL(s3_client, pg_client, table_name, need_spec_check=False, use_manifest=True)
     await etl.process_bucket("mldata")
 
     # Финализируем кластеризацию
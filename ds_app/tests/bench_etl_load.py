@@ -0,0 +1,64 @@
+"""Benchmark of the COPY and the INSERT load modes of S3ToPostgresETL.insert_data against a real Postgres.
+
+Rows of a wide synthetic table (secid, date and --columns float columns, like securities_data_1506) are loaded
+into an empty table with each mode, rows/s are printed for both.
+
+Usage (from ds_app directory, connection parameters are read from .env as in src/main.py):
+    python -m tests.bench_etl_load --rows 20000 --columns 200 --modes copy insert
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+
+from src.S3ToPostgresETL.S3ToPostgresETLv2 import S3ToPostgresETL
+from src.clients.db_client.src.simplest_pg_client.pg_client import PostgresClient
+
+
+def make_rows(rows: int, columns: list[str]) -> list[list]:
+    generator = random.Random(0)
+    start = date(2000, 1, 3)
+    result = []
+    for i in range(rows):
+        row = [f'sec{i % 50:03d}', str(start + timedelta(days=i // 50))]
+        row.extend(generator.random() if generator.random() > 0.05 else None for _ in columns)
+        result.append(row)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--modes', nargs='+', default=['copy', 'insert'])
+    parser.add_argument('--table', default='bench_etl_load')
+    args = parser.parse_args()
+
+    load_dotenv()
+    pg_client = PostgresClient(
+        host=os.getenv('FEATURES_DB_HOST'),
+        port=int(os.getenv('FEATURES_DB_PORT')),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        database=os.getenv('FEATURE_DB_NAME')
+    )
+    columns = [f'feature_{i}' for i in range(args.columns)]
+    rows = make_rows(args.rows, columns)
+
+    for mode in args.modes:
+        pg_client.execute(f'DROP TABLE IF EXISTS {args.table}')
+        etl = S3ToPostgresETL(None, pg_client, args.table, load_mode=mode, use_manifest=False)
+        etl.add_missing_columns(columns)
+        start_time = time.perf_counter()
+        etl.insert_data(['secid', 'date'] + columns, rows)
+        elapsed = time.perf_counter() - start_time
+        loaded = pg_client.execute(f'SELECT COUNT(*) FROM {args.table}')[0][0]
+        print(f'{mode:<6}: {elapsed:8.3f} s, {args.rows / elapsed:10.0f} rows/s, {loaded} rows loaded')
+    pg_client.execute(f'DROP TABLE IF EXISTS {args.table}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark of the sequential and the concurrent history download against the local ISS stand-in.
+
+Usage (from ds_app directory):
+    python -m tests.bench_history_modes --securities 20 --rows 1000 --latency 0.02 --concurrency 1 8 32
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.clients.moex_api.iss_client import MicexISSClient, UrlBuilder
+from src.clients.moex_api.ratelimit import RequestGovernor
+from iss_stand_in import ISSStandIn
+
+
+def run(client: MicexISSClient, sec_ids, filepath: str, concurrency: int | None) -> float:
+    start_time = time.perf_counter()
+    client.get_history_csv(sec_ids=sec_ids, filepath=filepath, concurrency=concurrency)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--securities', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='server delay per request, seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 32])
+    parser.add_argument('--rate', type=float, default=10000, help='client rate limit, requests per second')
+    args = parser.parse_args()
+
+    with ISSStandIn(args.securities, args.rows, args.page_size, args.latency) as stand_in, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = MicexISSClient(governor=RequestGovernor(rate=args.rate))
+        client.url_builder = UrlBuilder(stand_in.url)
+        sec_ids = set(stand_in.history)
+
+        baseline = os.path.join(tmp, 'sequential.csv')
+        stand_in.requests = 0
+        elapsed = run(client, sec_ids, baseline, None)
+        print(f'sequential      : {elapsed:8.3f} s, {stand_in.requests} requests')
+
+        for concurrency in args.concurrency:
+            filepath = os.path.join(tmp, f'concurrent_{concurrency}.csv')
+            stand_in.requests = 0
+            elapsed_async = run(client, sec_ids, filepath, concurrency)
+            identical = filecmp.cmp(baseline, filepath, shallow=False)
+            print(f'concurrency {concurrency:<4}: {elapsed_async:8.3f} s, {stand_in.requests} requests, '
+                  f'x{elapsed / elapsed_async:.1f}, identical output: {identical}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Local stand-in for the ISS server.
+
+Serves synthetic securities list, history cursor, history pages and intraday candles in the same
+format as iss.moex.com, so the client can be tested and benchmarked offline.
+ISSReplay serves the responses recorded by ISSRecorder from a fixture directory instead.
+The csv pages have the layout of the ISS responses: the block name, a blank line, the column names and the rows.
+"""
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+import requests
+
+HISTORY_COLUMNS = ['BOARDID', 'TRADEDATE', 'SECID', 'NUMTRADES', 'VALUE', 'OPEN', 'LOW', 'HIGH', 'LEGALCLOSEPRICE',
+                   'WAPRICE', 'CLOSE', 'VOLUME', 'MARKETPRICE2', 'MARKETPRICE3', 'ADMITTEDQUOTE', 'MP2VALTRD',
+                   'MARKETPRICE3TRADESVALUE', 'ADMITTEDVALUE', 'WAVAL', 'TRADINGSESSION', 'CURRENCYID', 'TRENDCLSPR']
+
+SECURITIES_COLUMNS = ['SECID', 'BOARDID', 'SHORTNAME', 'SECNAME', 'SECTYPE', 'LISTLEVEL']
+
+CANDLE_COLUMNS = ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end']
+
+
+def make_history(sec_id: str, rows: int, first_date: date = date(2020, 1, 3)):
+    """Builds synthetic history rows of the security."""
+    history = []
+    for i in range(rows):
+        price = round(100 + (sum(map(ord, sec_id)) * 31 + i * 7) % 1000 / 10, 2)
+        history.append({
+            'BOARDID': 'TQBR', 'TRADEDATE': (first_date + timedelta(days=i)).isoformat(), 'SECID': sec_id,
+            'NUMTRADES': 10 + i, 'VALUE': price * 1000, 'OPEN': price, 'LOW': price - 1, 'HIGH': price + 1,
+            'LEGALCLOSEPRICE': price, 'WAPRICE': price, 'CLOSE': price, 'VOLUME': 1000 + i,
+            'MARKETPRICE2': price, 'MARKETPRICE3': price, 'ADMITTEDQUOTE': '', 'MP2VALTRD': price * 1000,
+            'MARKETPRICE3TRADESVALUE': price * 1000, 'ADMITTEDVALUE': '', 'WAVAL': 0,
+            'TRADINGSESSION': 3, 'CURRENCYID': 'SUR', 'TRENDCLSPR': 0.5,
+        })
+    return history
+
+
+def make_candles(sec_id: str, day: date, interval: int, count: int):
+    """Builds synthetic candles of the security for a weekday, starting at 10:00."""
+    if day.weekday() > 4:
+        return []
+    candles = []
+    for i in range(count):
+        begin = datetime.combine(day, datetime.min.time()) + timedelta(hours=10, minutes=i * interval)
+        price = round(100 + (sum(map(ord, sec_id)) * 31 + day.toordinal() + i) % 1000 / 10, 2)
+        candles.append({
+            'open': price, 'close': price, 'high': price + 1, 'low': price - 1, 'value': price * 10,
+            'volume': 10 + i, 'begin': begin.isoformat(' '),
+            'end': (begin + timedelta(minutes=interval, seconds=-1)).isoformat(' '),
+        })
+    return candles
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ISSStandIn:
+    """ISS stand-in server running in a background thread.
+
+    Args:
+        securities: number of synthetic securities
+        rows: number of history rows of each security
+        page_size: ISS page size
+        latency: delay in seconds added to every response
+        errors: number of the first requests answered with 503 Service Unavailable
+        candles_per_day: number of intraday candles of each security per weekday
+        candles_page_size: max number of candles in a response
+        error_rate: share of the other requests answered with 503, drawn from a generator seeded with seed
+        seed: seed of the error injection, so the failed requests are the same from run to run
+    """
+
+    def __init__(self, securities: int = 5, rows: int = 250, page_size: int = 100, latency: float = 0.0,
+                 errors: int = 0, candles_per_day: int = 50, candles_page_size: int = 500,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.page_size = page_size
+        self.candles_per_day = candles_per_day
+        self.candles_page_size = candles_page_size
+        self.latency = latency
+        self.errors = errors
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.passport_ttl = 3600
+        self.authentications = 0
+        self.history = {f'SEC{i:03}': make_history(f'SEC{i:03}', rows) for i in range(securities)}
+        self.indexes = {'IMOEX': list(self.history)[:3]}
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}/'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def securities_json(self) -> str:
+        data = [[sec_id, 'TQBR', sec_id, f'{sec_id} PAO', '1', 1 + i % 3]
+                for i, sec_id in enumerate(self.history)]
+        return json.dumps({'securities': {'columns': SECURITIES_COLUMNS, 'data': data}})
+
+    def history_csv(self, sec_id: str, query: dict) -> str:
+        rows = [row for row in self.history.get(sec_id, [])
+                if query.get('from', '') <= row['TRADEDATE'] <= query.get('till', '9999-12-31')]
+        columns = query.get('history.columns', ','.join(HISTORY_COLUMNS)).split(',')
+        if query.get('iss.only', '').startswith('history.cursor'):
+            return f'history.cursor\n0;{len(rows)};{self.page_size}\n'
+        start = int(query.get('start', 0))
+        page = rows[start:start + self.page_size]
+        lines = ['history', '', ';'.join(columns)] + [';'.join(str(row[col]) for col in columns) for row in page]
+        return '\n'.join(lines) + '\n'
+
+    def history_json(self, sec_id: str, query: dict) -> str:
+        rows = [row for row in self.history.get(sec_id, [])
+                if query.get('from', '') <= row['TRADEDATE'] <= query.get('till', '9999-12-31')]
+        if query.get('sort_order') == 'desc':
+            rows = rows[::-1]
+        start = int(query.get('start', 0))
+        rows = rows[start:start + min(int(query.get('limit', self.page_size)), self.page_size)]
+        columns = query.get('history.columns', ','.join(HISTORY_COLUMNS)).split(',')
+        return json.dumps({'history': {'columns': columns, 'data': [[row[col] for col in columns] for row in rows]}})
+
+    def candles_csv(self, sec_id: str, query: dict) -> str:
+        """Candles of the days from `from` to `till` inclusive, like ISS does for dates without time."""
+        day, till = date.fromisoformat(query['from']), date.fromisoformat(query['till'])
+        candles = []
+        while day <= till:
+            candles += make_candles(sec_id, day, int(query.get('interval', 1)), self.candles_per_day)
+            day += timedelta(days=1)
+        start = int(query.get('start', 0))
+        columns = query.get('candles.columns', ','.join(CANDLE_COLUMNS)).split(',')
+        page = candles[start:start + self.candles_page_size]
+        lines = ['candles', '', ';'.join(columns)] + [';'.join(str(candle[col]) for col in columns) for candle in page]
+        return '\n'.join(lines) + '\n\n'
+
+    def analytics_json(self, index: str, query: dict) -> str:
+        start = int(query.get('start', 0))
+        tickers = self.indexes.get(index, [])[start:start + int(query.get('limit', 20))]
+        return json.dumps({'analytics': {'columns': ['indexid', 'secids'], 'data': [[index, t] for t in tickers]}})
+
+    def respond(self, path: str, query: dict):
+        """Returns the body of the response to the request or None if the resource is not found."""
+        if path.startswith('/iss/history/') and path.endswith('.csv'):
+            return self.history_csv(path.rsplit('/', 1)[-1][:-len('.csv')], query)
+        if path.startswith('/iss/history/') and '/securities/' in path and path.endswith('.json'):
+            return self.history_json(path.rsplit('/', 1)[-1][:-len('.json')], query)
+        if path.endswith('/candles.csv'):
+            return self.candles_csv(path.split('/')[-2], query)
+        if path.startswith('/iss/statistics/') and '/analytics/' in path:
+            return self.analytics_json(path.rsplit('/', 1)[-1][:-len('.json')], query)
+        if path.endswith('/securities.json'):
+            return self.securities_json()
+        return None
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    fail = stand_in.errors > 0 or stand_in._random.random() < stand_in.error_rate
+                    stand_in.errors -= stand_in.errors > 0
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if fail:
+                    self.send_error(503)
+                    return
+                parsed = urlparse(self.path)
+                if parsed.path == '/authenticate':
+                    self.authenticate()
+                    return
+                body = stand_in.respond(parsed.path, {key: values[0] for key, values in parse_qs(parsed.query).items()})
+                if body is None:
+                    self.send_error(404)
+                    return
+                payload = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def authenticate(self):
+                """Issues a new MOEX Passport certificate which expires in passport_ttl seconds."""
+                with stand_in._lock:
+                    stand_in.authentications += 1
+                    cert = f'cert-{stand_in.authentications}'
+                self.send_response(200)
+                self.send_header('Set-Cookie', f'MicexPassportCert={cert}; Path=/; '
+                                               f'Expires={formatdate(time.time() + stand_in.passport_ttl, usegmt=True)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def fixture_key(path: str, query: dict) -> str:
+    """Key of the recorded response which does not depend on the order and the encoding of the url parameters."""
+    return f'{path}?{urlencode(sorted(query.items()))}'
+
+
+class ISSReplay(ISSStandIn):
+    """ISS stand-in serving the responses recorded in the fixture directory.
+
+    Latency and error injection are the same as in ISSStandIn. Requests which were not recorded are answered
+    with 404 Not Found.
+
+    Args:
+        fixtures: directory with index.json and the bodies of the recorded responses
+    """
+
+    def __init__(self, fixtures: str, **kwargs):
+        super().__init__(securities=0, **kwargs)
+        with open(os.path.join(fixtures, 'index.json')) as file:
+            index = json.load(file)
+        self.responses = dict()
+        for key, filename in index.items():
+            with open(os.path.join(fixtures, filename), encoding='utf-8') as file:
+                self.responses[key] = file.read()
+
+    def respond(self, path: str, query: dict):
+        return self.responses.get(fixture_key(path, query))
+
+
+class ISSRecorder(ISSStandIn):
+    """ISS stand-in forwarding the requests to the upstream server and recording its responses.
+
+    Run the client against the recorder, then call save to write the fixture directory for ISSReplay.
+
+    Args:
+        upstream: address of the ISS server, e.g. https://iss.moex.com/
+    """
+
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(securities=0, **kwargs)
+        self.upstream = upstream.rstrip('/')
+        self.responses = dict()
+
+    def respond(self, path: str, query: dict):
+        response = requests.get(f'{self.upstream}{path}', params=query, timeout=30)
+        if response.status_code != 200:
+            return None
+        with self._lock:
+            self.responses[fixture_key(path, query)] = response.text
+        return response.text
+
+    def save(self, fixtures: str):
+        os.makedirs(fixtures, exist_ok=True)
+        index = dict()
+        for number, (key, body) in enumerate(sorted(self.responses.items())):
+            filename = f'{number:04}{os.path.splitext(urlparse(key).path)[1]}'
+            with open(os.path.join(fixtures, filename), 'w', encoding='utf-8') as file:
+                file.write(body)
+            index[key] = filename
+        with open(os.path.join(fixtures, 'index.json'), 'w') as file:
+            json.dump(index, file, indent=1)
@@ -0,0 +1,64 @@
+"""Records the ISS responses used by the replay benchmarks.
+
+The client runs the recorded scenario (list of the shares, history and intraday candles of a few securities)
+against ISSRecorder, which forwards the requests to the upstream server and writes the responses with
+the scenario into the fixture directory.
+
+Usage (from ds_app directory):
+    python -m tests.record_iss_fixtures --sec-ids SBER GAZP LKOH --date-interval '2024-01-01 2024-06-30'
+    python -m tests.record_iss_fixtures --synthetic
+
+The source of the fixtures (upstream url or "synthetic") is written to scenario.json. The fixtures in the repo are
+synthetic: recorded from ISSStandIn without network access. Record them from iss.moex.com when it is available,
+so that the replay checks the real layout of the ISS responses.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.clients.moex_api.iss_client import MicexISSClient, UrlBuilder
+from iss_stand_in import ISSStandIn, ISSRecorder
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'iss')
+
+
+def record(upstream: str, fixtures: str, scenario: dict, source: str | None = None):
+    with ISSRecorder(upstream) as recorder, tempfile.TemporaryDirectory() as tmp:
+        client = MicexISSClient()
+        client.url_builder = UrlBuilder(recorder.url)
+        client.get_stock_exchange_list()
+        client.get_history_csv(sec_ids=set(scenario['sec_ids']), date_interval=scenario['date_interval'],
+                               filepath=os.path.join(tmp, 'history.csv'))
+        client.get_candles_csv(sec_ids=set(scenario['sec_ids']), filepath=os.path.join(tmp, 'candles.csv'),
+                               **scenario['candles'])
+        recorder.save(fixtures)
+    with open(os.path.join(fixtures, 'scenario.json'), 'w') as file:
+        json.dump({**scenario, 'source': source or upstream}, file, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--upstream', default='https://iss.moex.com/')
+    parser.add_argument('--synthetic', action='store_true', help='record the synthetic ISSStandIn instead')
+    parser.add_argument('--out', default=FIXTURES)
+    parser.add_argument('--sec-ids', nargs='+', default=['SBER', 'GAZP', 'LKOH'])
+    parser.add_argument('--date-interval', default='2024-01-01 2024-06-30')
+    parser.add_argument('--candles-interval', default='2024-06-03 2024-06-07', help='dates of the 10 minute candles')
+    args = parser.parse_args()
+
+    scenario = {'sec_ids': args.sec_ids, 'date_interval': args.date_interval,
+                'candles': {'date_interval': args.candles_interval, 'interval': 10, 'chunk_days': 1}}
+    if args.synthetic:
+        scenario.update(sec_ids=['SEC000', 'SEC001', 'SEC002'], date_interval='2020-01-01 2020-04-30')
+        with ISSStandIn(securities=3, rows=120) as stand_in:
+            record(stand_in.url, args.out, scenario, source='synthetic')
+    else:
+        record(args.upstream, args.out, scenario)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""In-memory stand-in of the S3 client and a recording stand-in of the Postgres client for the ETL tests."""
+import hashlib
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List
+from unittest.mock import MagicMock
+
+from psycopg2 import sql
+
+
+class StreamingBody:
+    """ Body of an S3 object read with read() or read(amt), as aiobotocore StreamingBody.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+        self.reads = 0
+
+    async def read(self, amt: int | None = None) -> bytes:
+        self.reads += 1
+        end = len(self.data) if amt is None else self.position + amt
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class S3StandIn:
+    """ S3 client serving the objects of a single bucket from memory.
+    """
+
+    def __init__(self, objects: Dict[str, bytes]):
+        self.objects = objects
+        self.downloads: List[str] = []
+        self.bodies: List[StreamingBody] = []
+
+    async def get_object_list(self, bucket_name: str):
+        return [{'Key': key, 'Size': len(data), 'ETag': f'"{hashlib.md5(data).hexdigest()}"',
+                 'LastModified': '2024-06-03T00:00:00Z'} for key, data in self.objects.items()]
+
+    @asynccontextmanager
+    async def get_client(self):
+        client = MagicMock()
+
+        async def get_object(Bucket: str, Key: str):
+            self.downloads.append(Key)
+            body = StreamingBody(self.objects[Key])
+            self.bodies.append(body)
+            return {'Body': body}
+
+        client.get_object = get_object
+        yield client
+
+
+class PostgresStandIn:
+    """ Postgres client recording the queries, the executemany rows, the COPY payloads and the commits of its cursors.
+    """
+
+    def __init__(self, tables: Dict[str, List[str]] | None = None):
+        self.tables = tables if tables is not None else dict()
+        self.queries: List[str] = []
+        self.copied: List[str] = []
+        self.inserted: List[List] = []
+        self.connections = 0
+        self.threads = set()
+        self.manifest: Dict[str, tuple] = dict()
+        self.pool_sizes: List[int] = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    @contextmanager
+    def connection_pool(self, size: int):
+        self.pool_sizes.append(size)
+        yield self
+
+    @contextmanager
+    def get_cursor(self):
+        self.connections += 1
+        self.threads.add(threading.current_thread().name)
+        cursor = MagicMock()
+        cursor.execute.side_effect = lambda query, params=None: self.queries.append(self._text(query))
+        cursor.executemany.side_effect = lambda query, values: (self.queries.append(self._text(query)),
+                                                                self.inserted.extend(values))
+        cursor.copy_expert.side_effect = lambda query, file: (self.queries.append(self._text(query)),
+                                                              self.copied.append(file.read()))
+        cursor.description = None
+        try:
+            yield cursor
+        except Exception:
+            self.rollbacks += 1
+            raise
+        self.commits += 1
+
+    def execute(self, query, params=None):
+        self.threads.add(threading.current_thread().name)
+        self.queries.append(self._text(query))
+        if 'information_schema.columns' in self._text(query):
+            return [(column,) for column in self.tables.get(params[0], [])]
+        if 'MAX(date)' in self._text(query):
+            return [(None,)]
+        if '_load_manifest' in self._text(query) and self._text(query).lstrip().startswith('INSERT'):
+            self.manifest[params[0]] = tuple(params[1:])
+        elif '_load_manifest' in self._text(query) and self._text(query).startswith('SELECT'):
+            return [(key, etag, size) for key, (etag, size, _) in self.manifest.items()]
+        return None
+
+    def table_exists(self, table_name: str) -> bool:
+        return table_name in self.tables
+
+    @staticmethod
+    def _text(query) -> str:
+        """Renders a psycopg2.sql query without a connection, identifiers are double-quoted."""
+        if isinstance(query, str):
+            return query
+        if isinstance(query, sql.Composed):
+            return ''.join(PostgresStandIn._text(part) for part in query.seq)
+        if isinstance(query, sql.Identifier):
+            return '.'.join(f'"{name}"' for name in query.strings)
+        if isinstance(query, sql.Placeholder):
+            return '%s'
+        return query.string
@@ -0,0 +1,98 @@
+"""Benchmarks of the ISS client against the responses recorded in tests/fixtures/iss.
+
+The replay server adds a fixed latency to every response, so the numbers are reproducible offline
+and show the effect of the concurrent modes. Run only the benchmarks with:
+    python -m pytest tests/test_bench_iss_client.py --benchmark-only
+Refresh the fixtures with tests/record_iss_fixtures.py. The fixtures in the repo are synthetic (see the source
+in scenario.json): they were recorded from ISSStandIn, not from iss.moex.com.
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from src.clients.moex_api.iss_client import MicexISSClient, UrlBuilder
+from src.clients.moex_api.ratelimit import RequestGovernor
+from iss_stand_in import ISSReplay
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'iss')
+LATENCY = 0.005
+
+
+@pytest.fixture(scope='module')
+def scenario():
+    with open(os.path.join(FIXTURES, 'scenario.json')) as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope='module')
+def replay():
+    with ISSReplay(FIXTURES, latency=LATENCY) as replay:
+        yield replay
+
+
+@pytest.fixture
+def client(replay):
+    client = MicexISSClient(governor=RequestGovernor(rate=10000))
+    client.url_builder = UrlBuilder(replay.url)
+    client.get_stock_exchange_list()
+    yield client
+    client.shutdown()
+
+
+def _history_csv(client, scenario, filepath, **kwargs):
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    client.get_history_csv(sec_ids=set(scenario['sec_ids']), date_interval=scenario['date_interval'],
+                           filepath=filepath, **kwargs)
+    with open(filepath) as file:
+        return sum(1 for _ in file)
+
+
+@pytest.mark.benchmark(group='securities')
+def test_get_stock_exchange_list(benchmark, client):
+    securities = benchmark(client.get_stock_exchange_list, refresh=True)
+    assert securities
+
+
+@pytest.mark.benchmark(group='history')
+@pytest.mark.parametrize('mode', [{}, {'page_workers': 4}, {'concurrency': 8}],
+                         ids=['sequential', 'page_workers', 'concurrency'])
+def test_get_history_csv(benchmark, client, scenario, tmp_path, mode):
+    lines = benchmark.pedantic(_history_csv, args=(client, scenario, str(tmp_path / 'history.csv')), kwargs=mode,
+                               rounds=5)
+    assert lines > len(scenario['sec_ids'])
+
+
+@pytest.mark.benchmark(group='candles')
+@pytest.mark.parametrize('concurrency', [1, 8])
+def test_get_candles_csv(benchmark, client, scenario, tmp_path, concurrency):
+    filepath = str(tmp_path / 'candles.csv')
+
+    def get_candles():
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        client.get_candles_csv(sec_ids=set(scenario['sec_ids']), filepath=filepath, concurrency=concurrency,
+                               **scenario['candles'])
+
+    benchmark.pedantic(get_candles, rounds=5)
+    assert os.path.getsize(filepath)
+
+
+@pytest.mark.benchmark(group='parquet')
+@pytest.mark.parametrize('parse_workers', [None, 2], ids=['single_process', 'parse_workers'])
+def test_get_history_parquet(benchmark, client, scenario, tmp_path, parse_workers):
+    pytest.importorskip('pyarrow')
+    filepath = str(tmp_path / 'history.parquet')
+
+    def get_history():
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        client.get_history_parquet(sec_ids=set(scenario['sec_ids']), date_interval=scenario['date_interval'],
+                                   filepath=filepath, concurrency=8, parse_workers=parse_workers)
+
+    # the warmup round starts the pool of the parsers which is reused by the measured rounds
+    benchmark.pedantic(get_history, rounds=3, warmup_rounds=1)
+    assert os.path.getsize(filepath)
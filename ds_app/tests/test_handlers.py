@@ -0,0 +1,19 @@
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from src.clients.moex_api.handlers.handle import CSVHandler, CSVContainer
+
+
+class TestCSVHandler(TestCase):
+    def test_gzip_file_is_written_once_per_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = CSVHandler(CSVContainer)
+            handler.container.set_filepath(os.path.join(tmp, 'history.csv.gz'))
+            self.assertEqual(handler.container.compression, 'gzip')
+            with handler:
+                handler.process_the_data(['BOARDID;SECID'])
+                handler.process_the_data(['TQBR;SBER', 'TQBR;GAZP'])
+            with gzip.open(handler.container.filepath, 'rt') as file:
+                self.assertEqual(file.read(), 'BOARDID;SECID\nTQBR;SBER\nTQBR;GAZP\n')
@@ -1,6 +1,411 @@
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from src.clients.moex_api.iss_client import MicexISSClient, UrlBuilder, Config, MicexAuth
+from src.clients.moex_api.watermarks import WatermarkStore
+from src.clients.moex_api.checkpoint import CheckpointJournal
+from src.clients.moex_api.cert_store import PassportCertStore
+from src.clients.moex_api.cache import ISSResponseCache
+from src.clients.moex_api.ratelimit import RequestGovernor
+from src.exception.ds_exc import InvalidArgs, ISSRequestError
+from iss_stand_in import ISSStandIn, ISSReplay, make_history, make_candles
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'iss')
+
+
+class TestUrlBuilder(TestCase):
+    def test_prepared_urls_match_built_urls(self):
+        builder = UrlBuilder()
+        params = {'iss.only': 'history', 'history.columns': 'SECID,TRADEDATE', 'from': '2024-01-01'}
+        prepared = builder.prepare(response_format='csv', emb=builder.DEFAULT_EMB, params=params)
+        url = prepared.for_security('SBER')
+        self.assertEqual(url.url, builder.build_url(response_format='csv', emb=builder.DEFAULT_EMB,
+                                                    params=params, sec_id='SBER'))
+        self.assertEqual(url.page(200), url.url + '&start=200')
+        self.assertEqual(url.cursor, builder.build_url(
+            response_format='csv', emb=builder.DEFAULT_EMB, sec_id='SBER',
+            params={**params, 'iss.only': 'history.cursor', 'iss.meta': 'off'}))
+        self.assertTrue(prepared.for_security('SBER', till='2024-01-31 18:00').url.endswith(
+            '&from=2024-01-01&till=2024-01-31%2018%3A00'))
+
+
+class TestMicexAuth(TestCase):
+    def test_certificate_is_reused_and_refreshed_before_expiry(self):
+        with ISSStandIn(securities=1) as stand_in, tempfile.TemporaryDirectory() as tmp:
+            config = Config(user='user', password='password', cert_store_path=os.path.join(tmp, 'certs.json'),
+                            refresh_margin=60)
+            config.auth_url = stand_in.url + 'authenticate'
+            MicexAuth(config)
+            auth = MicexAuth(config)
+            self.assertEqual(stand_in.authentications, 1)
+            self.assertEqual(auth.cookies.get('MicexPassportCert'), 'cert-1')
+            self.assertTrue(auth.ensure_auth())
+            self.assertEqual(stand_in.authentications, 1)
+
+            # the stored certificate expires within the refresh margin
+            PassportCertStore(config.cert_store_path).save('user', 'cert-1', expires=time.time() + 30)
+            auth.expires = time.time() + 30
+            self.assertTrue(auth.ensure_auth())
+            self.assertEqual(stand_in.authentications, 2)
+            self.assertEqual(auth.cookies.get('MicexPassportCert'), 'cert-2')
+            self.assertEqual(PassportCertStore(config.cert_store_path).get('user', 60)['value'], 'cert-2')
+
+    def test_failed_authentication_is_not_repeated_before_every_request(self):
+        with ISSStandIn(securities=1, rows=250, page_size=100) as stand_in, tempfile.TemporaryDirectory() as tmp:
+            config = Config(user='user', password='wrong')
+            config.auth_url = stand_in.url + 'missing'
+            client = MicexISSClient(auth=MicexAuth(config))
+            client.url_builder = UrlBuilder(stand_in.url)
+            self.assertFalse(client.auth.needs_refresh())
+            stand_in.requests = 0
+            client.get_history_csv(sec_ids={'SEC000'}, filepath=os.path.join(tmp, 'sync.csv'))
+            client.get_history_csv(sec_ids={'SEC000'}, filepath=os.path.join(tmp, 'async.csv'), concurrency=2)
+            # the securities list, the cursor and three pages, then the cursor and three pages
+            self.assertEqual(stand_in.requests, 1 + 1 + 3 + 1 + 3)
+
+            client.auth.config.auth_url = stand_in.url + 'authenticate'
+            client.auth._retry_at = 0
+            self.assertTrue(client.auth.needs_refresh())
+            client.get_history_csv(sec_ids={'SEC000'}, filepath=os.path.join(tmp, 'async.csv'), concurrency=2)
+            self.assertEqual(stand_in.authentications, 1)
+            self.assertEqual(client.auth.cookies.get('MicexPassportCert'), 'cert-1')
 
 
 class TestMicexISSClient(TestCase):
+    @contextmanager
+    def serve(self, client: MicexISSClient | None = None, **stand_in_args):
+        """Runs ISSStandIn with the args and points the client (a new one by default) at it."""
+        with ISSStandIn(**stand_in_args) as stand_in:
+            client = client or MicexISSClient()
+            client.url_builder = UrlBuilder(stand_in.url)
+            yield stand_in, client
+
     def test_transfer_data_to_sql(self):
-        self.fail()
+        cursor = MagicMock()
+        copied = []
+        cursor.copy_expert.side_effect = lambda query, file: copied.append(file.read())
+        pg_client = MagicMock()
+        pg_client.get_cursor.return_value.__enter__.return_value = cursor
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client):
+            client.transfer_data_to_db(pg_client, table_name='history', sec_ids={'SEC001'})
+        pg_client.get_cursor.assert_called_once()
+        self.assertEqual(len(copied), 3)
+        rows = ''.join(copied).split()
+        self.assertEqual([row.split(';')[1] for row in rows],
+                         [row['TRADEDATE'] for row in stand_in.history['SEC001']])
+        # create table, create staging table and a merge after the security, nothing is left to merge on close
+        self.assertEqual(cursor.execute.call_count, 3)
+        cursor.connection.commit.assert_called_once()
+
+    def test_transfer_data_to_sql_commits_every_security(self):
+        cursor = MagicMock()
+        pg_client = MagicMock()
+        pg_client.get_cursor.return_value.__enter__.return_value = cursor
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client):
+            get_history_page = client._get_history_page
+
+            def fail_on_second_security(url):
+                if 'SEC001' in url:
+                    raise ISSRequestError()
+                return get_history_page(url)
+
+            with patch.object(client, '_get_history_page', side_effect=fail_on_second_security):
+                with self.assertRaises(ISSRequestError):
+                    client.transfer_data_to_db(pg_client, table_name='history', sec_ids=set(stand_in.history))
+        # the first security is merged and committed before the failure
+        cursor.connection.commit.assert_called_once()
+        self.assertEqual(sum('INSERT INTO' in repr(call) for call in cursor.execute.call_args_list), 1)
+
+    def test_get_history_csv_concurrent_matches_sequential(self):
+        with self.serve(securities=4, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            sequential = os.path.join(tmp, 'sequential.csv')
+            concurrent = os.path.join(tmp, 'concurrent.csv')
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=sequential)
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=concurrent, concurrency=3)
+            with open(sequential) as expected, open(concurrent) as actual:
+                expected_lines = expected.readlines()
+                self.assertEqual(expected_lines, actual.readlines())
+            self.assertEqual(len(expected_lines), 1 + 4 * 250)
+
+    def test_metrics_of_history_download(self):
+        with self.serve(MicexISSClient(governor=RequestGovernor(backoff_base=0.001)),
+                        securities=2, rows=250, page_size=100, errors=1) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=os.path.join(tmp, 'history.csv'),
+                                   concurrency=2)
+            summary = client.metrics.summary()
+            self.assertEqual(summary['iss_retries_total'][''], 1)
+            self.assertEqual(summary['iss_request_duration_seconds']['']['count'], stand_in.requests - 1)
+            self.assertEqual(summary['iss_page_rows']['']['count'], 2 * 3)
+            self.assertEqual(summary['iss_page_rows']['']['sum'], 2 * 250)
+            self.assertEqual(summary['iss_security_duration_seconds']['']['count'], 2)
+            self.assertEqual(summary['iss_method_duration_seconds']['{method="get_history_csv"}']['count'], 1)
+            exposition = client.metrics.to_prometheus()
+            self.assertIn('# TYPE iss_request_duration_seconds histogram', exposition)
+            self.assertIn('iss_page_rows_bucket{le="+Inf"} 6', exposition)
+            self.assertIn('iss_retries_total 1', exposition)
+
+    def test_get_history_csv_single_cursor_request_and_page_workers(self):
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            sequential = os.path.join(tmp, 'sequential.csv')
+            threaded = os.path.join(tmp, 'threaded.csv')
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=sequential)
+            stand_in.requests = 0
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=threaded, page_workers=3)
+            # one cursor and three pages per security, the securities list is kept in memory
+            self.assertEqual(stand_in.requests, 2 * (1 + 3))
+            with open(sequential) as expected, open(threaded) as actual:
+                self.assertEqual(expected.readlines(), actual.readlines())
+
+    def test_get_history_csv_incremental_sync(self):
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            watermarks = WatermarkStore(os.path.join(tmp, 'watermarks.json'))
+            first_run = os.path.join(tmp, 'first.csv')
+            client.get_history_csv(sec_ids={'SEC000'}, filepath=first_run, watermarks=watermarks)
+            last_date = stand_in.history['SEC000'][-1]['TRADEDATE']
+            self.assertEqual(str(WatermarkStore(watermarks.filepath).get({'engines': 'stock', 'markets': 'shares'},
+                                                                         'SEC000')), last_date)
+
+            stand_in.history['SEC000'] += make_history('SEC000', 252)[250:]
+            second_run = os.path.join(tmp, 'second.csv')
+            client.get_history_csv(sec_ids={'SEC000'}, filepath=second_run, watermarks=watermarks)
+            with open(second_run) as file:
+                rows = file.read().split()[1:]
+            self.assertEqual([row.split(';')[1] for row in rows],
+                             [row['TRADEDATE'] for row in stand_in.history['SEC000'][250:]])
+
+    def test_get_history_csv_response_cache(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                self.serve(MicexISSClient(cache=ISSResponseCache(os.path.join(tmp, 'cache.sqlite'))),
+                           securities=2, rows=250, page_size=100) as (stand_in, client):
+            first_run = os.path.join(tmp, 'first.csv')
+            second_run = os.path.join(tmp, 'second.csv')
+            client.get_history_csv(sec_ids={'SEC000'}, date_interval='2020-01-01 2020-12-31', filepath=first_run)
+            stand_in.requests = 0
+            client.get_history_csv(sec_ids={'SEC000'}, date_interval='2020-01-01 2020-12-31', filepath=second_run,
+                                   concurrency=2)
+            self.assertEqual(stand_in.requests, 0)
+            with open(first_run) as expected, open(second_run) as actual:
+                self.assertEqual(expected.readlines(), actual.readlines())
+            client.cache.close()
+
+    def test_response_cache_expiration_and_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ISSResponseCache(os.path.join(tmp, 'cache.sqlite'), ttl=-1, max_size=10)
+            past = 'https://iss.moex.com/iss/history/engines/stock/markets/shares/securities/SBER.csv?till=2020-01-01'
+            cache.set(past, b'12345', 'utf-8')
+            cache.set('https://iss.moex.com/iss/engines/stock/markets/shares/securities.json', b'123', 'utf-8')
+            self.assertEqual(cache.get(past), (b'12345', 'utf-8'))
+            self.assertIsNone(cache.get('https://iss.moex.com/iss/engines/stock/markets/shares/securities.json'))
+            cache.set(past + '&start=100', b'123456', 'utf-8')
+            self.assertIsNone(cache.get(past))
+            cache.close()
+
+    def test_securities_universe_is_memoized(self):
+        with self.serve(securities=6) as (stand_in, client):
+            self.assertEqual(sorted(client._get_list_of_stocks(list_level=1)), ['SEC000', 'SEC003'])
+            self.assertEqual(client._get_list_of_stocks(sec_ids={'sec001', 'unknown'}), ['SEC001'])
+            self.assertEqual(stand_in.requests, 1)
+            client.get_stock_exchange_list(refresh=True)
+            self.assertEqual(stand_in.requests, 2)
+
+    def test_get_history_parquet_typed_columns(self):
+        import pyarrow.parquet as pq
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, 'history.parquet')
+            client.get_history_parquet(sec_ids=set(stand_in.history), filepath=filepath, row_group_size=200,
+                                       concurrency=2)
+            parquet_file = pq.ParquetFile(filepath)
+            table = parquet_file.read()
+            self.assertEqual(table.num_rows, 500)
+            self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+            self.assertEqual(str(table.schema.field('TRADEDATE').type), 'date32[day]')
+            self.assertEqual(str(table.schema.field('VOLUME').type), 'int64')
+            self.assertEqual(table.column('ADMITTEDQUOTE').null_count, 500)
+
+    def test_get_history_df_typed_columns(self):
+        with self.serve(securities=2, rows=250, page_size=100) as (stand_in, client):
+            df = client.get_history_df(sec_ids=set(stand_in.history), concurrency=2)
+        self.assertEqual(len(df), 500)
+        self.assertEqual(str(df['SECID'].dtype), 'category')
+        self.assertEqual(str(df['TRADEDATE'].dtype), 'datetime64[ns]')
+        self.assertEqual(str(df['VOLUME'].dtype), 'Int64')
+        self.assertEqual(str(df['CLOSE'].dtype), 'float64')
+        self.assertTrue(df['ADMITTEDQUOTE'].isna().all())
+
+    def test_parse_workers_match_single_process_parsing(self):
+        import pandas as pd
+        import pyarrow.parquet as pq
+        with self.serve(securities=3, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            sec_ids = set(stand_in.history)
+            watermarks = WatermarkStore(os.path.join(tmp, 'watermarks.json'))
+            pd.testing.assert_frame_equal(client.get_history_df(sec_ids=sec_ids, concurrency=2),
+                                          client.get_history_df(sec_ids=sec_ids, concurrency=2, parse_workers=2,
+                                                                watermarks=watermarks))
+            executor = client._parse_executor
+            serial, parallel = os.path.join(tmp, 'serial.parquet'), os.path.join(tmp, 'parallel.parquet')
+            client.get_history_parquet(sec_ids=sec_ids, filepath=serial, concurrency=2, row_group_size=200)
+            client.get_history_parquet(sec_ids=sec_ids, filepath=parallel, concurrency=2, row_group_size=200,
+                                       parse_workers=2)
+            # the pool of the parsers is reused by the next calls
+            self.assertIs(client._parse_executor, executor)
+            client.shutdown()
+            self.assertIsNone(client._parse_executor)
+            self.assertTrue(pq.read_table(serial).equals(pq.read_table(parallel)))
+            self.assertEqual(pq.ParquetFile(parallel).metadata.num_row_groups, 4)
+        self.assertEqual(watermarks.get(UrlBuilder().DEFAULT_EMB, 'SEC000').isoformat(),
+                         stand_in.history['SEC000'][-1]['TRADEDATE'])
+
+    def test_requests_are_retried_with_backoff(self):
+        for concurrency in (None, 2):
+            with self.serve(MicexISSClient(governor=RequestGovernor(backoff_base=0.001)),
+                            securities=2, rows=250, page_size=100, errors=3) as (stand_in, client), \
+                    tempfile.TemporaryDirectory() as tmp:
+                client.get_history_csv(sec_ids={'SEC000'}, filepath=os.path.join(tmp, 'history.csv'),
+                                       concurrency=concurrency)
+                with open(os.path.join(tmp, 'history.csv')) as file:
+                    self.assertEqual(len(file.readlines()), 251)
+                self.assertEqual(client.governor.stats['retries'], 3)
+
+    def test_request_fails_after_retries(self):
+        with self.serve(MicexISSClient(governor=RequestGovernor(retries=2, backoff_base=0.001)),
+                        errors=10) as (stand_in, client):
+            with self.assertRaises(ISSRequestError):
+                client._get_get(stand_in.url + 'iss/engines/stock/markets/shares/securities.json')
+            self.assertEqual(stand_in.requests, 3)
+            self.assertEqual(client.governor.stats['failures'], 1)
+
+    def test_request_fails_on_not_found_without_retries(self):
+        with self.serve(MicexISSClient(governor=RequestGovernor(retries=2, backoff_base=0.001))) as (stand_in, client):
+            with self.assertRaises(ISSRequestError):
+                client._get_get(stand_in.url + 'iss/engines/stock/markets/shares/unknown.csv')
+            self.assertEqual(stand_in.requests, 1)
+            self.assertEqual(client.governor.stats['failures'], 1)
+
+    def test_candles_for_dashboard_do_not_block_the_loop(self):
+        async def fetch(client: MicexISSClient):
+            async with client:
+                started = time.perf_counter()
+                results = await asyncio.gather(client.get_candles_for_dashboard('IMOEX', days=30),
+                                               client.get_candles_for_dashboard('IMOEX', days=10))
+                return results, time.perf_counter() - started
+
+        with self.serve(securities=0, latency=0.2) as (stand_in, client):
+            stand_in.history['IMOEX'] = make_history('IMOEX', 40)
+            (month, decade), elapsed = asyncio.run(fetch(client))
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual((len(month), len(decade)), (30, 10))
+        self.assertEqual(set(month[0]), {'time', 'open', 'low', 'high', 'close'})
+
+    def test_candles_batch_for_index_composition(self):
+        with self.serve(securities=5, rows=250) as (stand_in, client):
+            candles = client._run_async(client.get_candles_batch(tickers=['sec004'], index='IMOEX', days=120))
+        self.assertEqual(list(candles), ['SEC004', 'SEC000', 'SEC001', 'SEC002'])
+        self.assertEqual(len(candles['SEC000']['time']), 120)
+        self.assertEqual(candles['SEC000']['time'][-1], stand_in.history['SEC000'][-1]['TRADEDATE'])
+        self.assertEqual(candles['SEC000']['time'], sorted(candles['SEC000']['time']))
+
+    def test_candles_batch_rejects_zero_concurrency(self):
+        client = MicexISSClient()
+        with self.assertRaises(InvalidArgs):
+            client._run_async(client.get_candles_batch(tickers=['SEC000'], concurrency=0))
+
+    def test_get_candles_chunked_fetch_deduplicates_boundaries(self):
+        with self.serve(securities=3, candles_per_day=30, candles_page_size=20) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            client.CANDLES_PAGE_SIZE = stand_in.candles_page_size
+            args = dict(sec_ids={'SEC000', 'SEC002'}, date_interval='2024-01-01 2024-01-20', interval=10,
+                        chunk_days=3)
+            df = client.get_candles_df(**args)
+            client.get_candles_csv(filepath=os.path.join(tmp, 'sequential.csv'), concurrency=1, **args)
+            client.get_candles_csv(filepath=os.path.join(tmp, 'concurrent.csv'), concurrency=8, **args)
+            with open(os.path.join(tmp, 'sequential.csv')) as sequential, \
+                    open(os.path.join(tmp, 'concurrent.csv')) as concurrent:
+                self.assertEqual(sequential.read(), concurrent.read())
+        expected = [candle['begin'] for day in range(1, 21)
+                    for candle in make_candles('SEC000', date(2024, 1, day), 10, 30)]
+        self.assertEqual(len(df), 2 * len(expected))
+        sec000 = df[df['SECID'] == 'SEC000']
+        self.assertEqual(sec000['BEGIN'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(), expected)
+        self.assertEqual(str(df['BEGIN'].dtype), 'datetime64[ns]')
+
+    def test_sync_methods_inside_running_event_loop(self):
+        with self.serve(securities=2, candles_per_day=30) as (stand_in, client), tempfile.TemporaryDirectory() as tmp:
+            args = dict(sec_ids={'SEC000'}, date_interval='2024-01-01 2024-01-05', interval=10, concurrency=1)
+
+            async def notebook_cell():
+                client.get_history_csv(sec_ids={'SEC001'}, filepath=os.path.join(tmp, 'history.csv'), concurrency=2)
+                return client.get_candles_df(**args)
+
+            df = asyncio.run(notebook_cell())
+        self.assertEqual(len(df), 5 * 30)
+
+    def test_replay_of_recorded_responses_with_error_injection(self):
+        with ISSReplay(FIXTURES, error_rate=0.3, seed=1) as replay, tempfile.TemporaryDirectory() as tmp:
+            client = MicexISSClient(governor=RequestGovernor(rate=1000, backoff_base=0.01, retries=10))
+            client.url_builder = UrlBuilder(replay.url)
+            filepath = os.path.join(tmp, 'history.csv')
+            client.get_history_csv(sec_ids={'SEC000', 'SEC001'}, date_interval='2020-01-01 2020-04-30',
+                                   filepath=filepath, concurrency=4)
+            with open(filepath) as file:
+                # the recorded history of each security has 119 trading days till 2020-04-30
+                self.assertEqual(len(file.readlines()), 1 + 2 * 119)
+        self.assertGreater(client.governor.stats['retries'], 0)
+
+    def test_get_history_csv_resumes_interrupted_run_from_journal(self):
+        with self.serve(securities=3, rows=250, page_size=100) as (stand_in, client), \
+                tempfile.TemporaryDirectory() as tmp:
+            expected = os.path.join(tmp, 'expected.csv')
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=expected)
+
+            filepath = os.path.join(tmp, 'history.csv')
+            journal_path = os.path.join(tmp, 'history.journal')
+            get_history_page = client._get_history_page
+            received = []
+
+            def fail_after_five_pages(url):
+                if len(received) == 5:
+                    raise ISSRequestError()
+                received.append(url)
+                return get_history_page(url)
+
+            watermarks_path = os.path.join(tmp, 'watermarks.json')
+            with patch.object(client, '_get_history_page', side_effect=fail_after_five_pages):
+                with self.assertRaises(ISSRequestError):
+                    client.get_history_csv(sec_ids=set(stand_in.history), filepath=filepath,
+                                           journal=CheckpointJournal(journal_path),
+                                           watermarks=WatermarkStore(watermarks_path))
+            with open(filepath, 'a') as file:
+                file.write('partially written page')
+            # the watermark of the written security is saved by the interrupted run
+            emb = {'engines': 'stock', 'markets': 'shares'}
+            self.assertEqual(str(WatermarkStore(watermarks_path).get(emb, 'SEC000')),
+                             stand_in.history['SEC000'][-1]['TRADEDATE'])
+            # and restored from the journal if the process died before saving it
+            os.remove(watermarks_path)
+
+            stand_in.requests = 0
+            client.get_history_csv(sec_ids=set(stand_in.history), filepath=filepath, concurrency=2,
+                                   journal=CheckpointJournal(journal_path), watermarks=WatermarkStore(watermarks_path))
+            # the first security is skipped, the second one continues from its third page
+            self.assertEqual(stand_in.requests, (1 + 1) + (1 + 3))
+            # the order of the securities does not depend on the iteration order of the set
+            self.assertEqual(client._get_list_of_stocks(sec_ids=set(stand_in.history)), sorted(stand_in.history))
+            watermarks = WatermarkStore(watermarks_path)
+            for sec_id, rows in stand_in.history.items():
+                self.assertEqual(str(watermarks.get(emb, sec_id)), rows[-1]['TRADEDATE'])
+            with open(expected) as expected_file, open(filepath) as resumed_file:
+                self.assertEqual(expected_file.read(), resumed_file.read())
+            self.assertFalse(os.path.exists(journal_path))
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'history (1).csv')))
@@ -0,0 +1,32 @@
+import json
+from unittest import TestCase
+
+from src.clients.moex_api.json_stream import read_block, read_block_columns
+
+
+class TestISSBlockDecoder(TestCase):
+    payload = json.dumps({
+        'securities': {
+            'metadata': {'SECID': {'type': 'string'}, 'SECNAME': {'type': 'string'}},
+            'columns': ['SECID', 'BOARDID', 'SECNAME', 'PREVPRICE', 'LISTLEVEL'],
+            'data': [['SBER', 'TQBR', 'Сбербанк России ПАО ао', 301.5, 1],
+                     ['GAZP', 'TQBR', 'ГАЗПРОМ ао', None, 1],
+                     ['ABIO', 'TQBR', 'ПАО "Артген", [ао]', 80.1, 3]],
+        },
+        'marketdata': {'columns': ['SECID'], 'data': [['SBER']]},
+    }, ensure_ascii=False).encode('utf-8')
+
+    def test_rows_are_decoded_from_any_chunking(self):
+        expected = [('SBER', 1, 301.5), ('GAZP', 1, None), ('ABIO', 3, 80.1)]
+        for size in (1, 3, 7, 64, len(self.payload)):
+            chunks = [self.payload[i:i + size] for i in range(0, len(self.payload), size)]
+            self.assertEqual(read_block(chunks, 'securities', ('SECID', 'LISTLEVEL', 'PREVPRICE')), expected)
+
+    def test_column_arrays(self):
+        arrays = read_block_columns([self.payload], 'securities', ('SECID', 'SECNAME'))
+        self.assertEqual(arrays['SECID'], ['SBER', 'GAZP', 'ABIO'])
+        self.assertEqual(arrays['SECNAME'][2], 'ПАО "Артген", [ао]')
+
+    def test_incomplete_block(self):
+        with self.assertRaises(ValueError):
+            read_block([self.payload[:100]], 'securities', ('SECID',))
@@ -0,0 +1,30 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.clients.db_client.src.simplest_pg_client.pg_client import PostgresClient
+
+
+class TestPostgresClient(TestCase):
+    def setUp(self):
+        self.pg_client = PostgresClient('localhost', 5432, 'user', 'password', 'features')
+
+    def test_connection_per_query_without_pool(self):
+        with patch('psycopg2.connect') as connect:
+            for _ in range(3):
+                self.pg_client.execute('SELECT 1')
+        self.assertEqual(connect.call_count, 3)
+        self.assertEqual(connect.return_value.close.call_count, 3)
+
+    def test_pooled_connection_is_reused(self):
+        with patch('psycopg2.connect') as connect:
+            connect.return_value.closed = 0
+            with self.pg_client.connection_pool(2):
+                for _ in range(3):
+                    self.pg_client.execute('SELECT 1')
+                connect.return_value.close.assert_not_called()
+            self.assertEqual(connect.call_count, 1)
+            self.assertEqual(connect.return_value.commit.call_count, 3)
+            connect.return_value.close.assert_called_once()
+            # without the pool every query opens its own connection again
+            self.pg_client.execute('SELECT 1')
+        self.assertEqual(connect.call_count, 2)
@@ -0,0 +1,157 @@
+import asyncio
+import csv
+import io
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.S3ToPostgresETL import S3ToPostgresETLv2
+from src.S3ToPostgresETL.S3ToPostgresETLv2 import S3ToPostgresETL, get_column_plan
+from s3_stand_in import S3StandIn, PostgresStandIn
+
+ASTR_FINAL = os.path.join(os.path.dirname(__file__), 'ASTR_final.csv')
+
+
+def read_astr() -> bytes:
+    with open(ASTR_FINAL, 'rb') as file:
+        return file.read()
+
+
+class TestS3ToPostgresETL(TestCase):
+    def load(self, load_mode: str, **kwargs) -> PostgresStandIn:
+        pg_client = PostgresStandIn({'securities': ['secid', 'date']})
+        etl = S3ToPostgresETL(S3StandIn({'ASTR_final.csv': read_astr()}), pg_client, 'securities',
+                              need_spec_check=False, load_mode=load_mode, **kwargs)
+        asyncio.run(etl.process_bucket('mldata'))
+        return pg_client
+
+    def test_copy_loads_the_same_rows_as_insert(self):
+        inserted = self.load('insert')
+        copied = self.load('copy')
+        copy_rows = [[value if value else None for value in row]
+                     for payload in copied.copied for row in csv.reader(io.StringIO(payload))]
+        insert_rows = [[None if value is None else str(value) for value in row] for row in inserted.inserted]
+        self.assertEqual(len(insert_rows), 383)
+        self.assertEqual(copy_rows, insert_rows)
+        merge = [query for query in copied.queries if query.startswith('INSERT INTO')]
+        self.assertEqual(len(merge), 1)
+        self.assertIn('SELECT', merge[0])
+        self.assertTrue(merge[0].endswith('FROM "securities_stage" ON CONFLICT (secid, date) DO NOTHING'))
+
+    def test_streamed_file_is_flushed_in_bounded_batches(self):
+        whole = self.load('insert')
+        streamed = self.load('insert', batch_size=100, chunk_size=4096)
+        self.assertEqual(streamed.inserted, whole.inserted)
+        batches = [query for query in streamed.queries if query.startswith('INSERT INTO "securities_stage"')]
+        self.assertEqual(len(batches), 4)
+        # the batches of the file are merged into the main table once, in one transaction
+        merges = [query for query in streamed.queries if query.startswith('INSERT INTO "securities" ')]
+        self.assertEqual(len(merges), 1)
+        self.assertEqual((streamed.commits, streamed.rollbacks), (1, 0))
+
+    def test_failed_file_is_rolled_back(self):
+        pg_client = PostgresStandIn({'securities': ['secid', 'date']})
+        etl = S3ToPostgresETL(S3StandIn({'ASTR_final.csv': read_astr()}), pg_client, 'securities',
+                              need_spec_check=False, batch_size=100, chunk_size=4096)
+        stage_rows = etl.stage_rows
+        calls = []
+
+        def fail_third_batch(cursor, columns, rows):
+            calls.append(len(rows))
+            if len(calls) == 3:
+                raise ValueError('connection lost')
+            stage_rows(cursor, columns, rows)
+
+        etl.stage_rows = fail_third_batch
+        with self.assertRaises(ValueError):
+            asyncio.run(etl.process_file('mldata', 'ASTR_final.csv', 'astr'))
+        self.assertEqual(len(pg_client.copied), 2)
+        self.assertFalse(any(query.startswith('INSERT INTO "securities" ') for query in pg_client.queries))
+        self.assertEqual((pg_client.commits, pg_client.rollbacks), (0, 1))
+
+    def test_stream_keeps_quoted_newlines_and_split_characters(self):
+        data = 'date,SECID,Note\n2024-06-03,ASTR,"first\nline"\n2024-06-04,ASTR,цена\n2024-06-05,ASTR,"a,""b"""\n'
+        s3_client = S3StandIn({'ASTR_final.csv': data.encode('utf-8')})
+        etl = S3ToPostgresETL(s3_client, PostgresStandIn(), 'securities', chunk_size=3)
+
+        async def read():
+            return [row async for text in etl.stream_csv_text('mldata', 'ASTR_final.csv')
+                    for row in csv.reader(io.StringIO(text))]
+
+        self.assertEqual(asyncio.run(read()), list(csv.reader(io.StringIO(data))))
+        self.assertGreater(s3_client.bodies[0].reads, 10)
+
+    def test_files_are_processed_concurrently_with_serialized_ddl(self):
+        data = read_astr()
+        tickers = ['ASTR', 'SBER', 'GAZP', 'LKOH', 'YDEX']
+        pg_client = PostgresStandIn({'securities': ['secid', 'date']})
+        s3_client = S3StandIn({f'{ticker}_final.csv': data for ticker in tickers})
+        etl = S3ToPostgresETL(s3_client, pg_client, 'securities', need_spec_check=False, load_mode='insert',
+                              batch_size=100, chunk_size=4096, file_workers=3, db_workers=2)
+        asyncio.run(etl.process_bucket('mldata'))
+        self.assertEqual(len(pg_client.inserted), len(tickers) * 383)
+        # rows are positional, in the order of the insert columns of the plan
+        header, *rows = csv.reader(io.StringIO(data.decode()))
+        secid = get_column_plan(tuple(header), need_check=False).insert_columns.index('secid')
+        self.assertEqual({row[secid] for row in pg_client.inserted}, {row[header.index('SECID')] for row in rows})
+        # every new column is added once, the table columns are read once per run
+        alters = [query for query in pg_client.queries if query.startswith('ALTER TABLE')]
+        self.assertEqual(len(alters), len(set(alters)))
+        self.assertEqual(len(alters), len(next(csv.reader(io.StringIO(data.decode())))) - 2)
+        self.assertEqual(sum('information_schema.columns' in query for query in pg_client.queries), 1)
+        self.assertEqual({thread.rsplit('_', 1)[0] for thread in pg_client.threads - {'MainThread'}}, {'pg-writer'})
+        self.assertLessEqual(len(pg_client.threads - {'MainThread'}), 2)
+        # the writers share one pool of db_workers connections for the run
+        # the files hold file_workers connections, the writers share db_workers more for the run
+        self.assertEqual(pg_client.pool_sizes, [3 + 2])
+
+    def test_chunks_parsed_in_processes_load_the_same_rows(self):
+        whole = self.load('insert')
+        parsed = self.load('insert', batch_size=100, chunk_size=4096, parse_workers=2)
+        self.assertEqual(parsed.inserted, whole.inserted)
+
+    def test_unchanged_objects_are_skipped_by_manifest(self):
+        data = read_astr()
+        pg_client = PostgresStandIn({'securities': ['secid', 'date']})
+        s3_client = S3StandIn({f'{ticker}_final.csv': data for ticker in ('ASTR', 'SBER', 'GAZP')})
+        etl = S3ToPostgresETL(s3_client, pg_client, 'securities', need_spec_check=False, file_workers=2,
+                              use_manifest=True)
+        asyncio.run(etl.process_bucket('mldata'))
+        self.assertEqual(sorted(pg_client.manifest), ['ASTR_final.csv', 'GAZP_final.csv', 'SBER_final.csv'])
+
+        s3_client.downloads.clear()
+        asyncio.run(etl.process_bucket('mldata'))
+        self.assertEqual(s3_client.downloads, [])
+
+        s3_client.objects['SBER_final.csv'] = data + data.splitlines(keepends=True)[-1]
+        asyncio.run(etl.process_bucket('mldata'))
+        self.assertEqual(s3_client.downloads, ['SBER_final.csv'])
+        self.assertEqual(pg_client.manifest['SBER_final.csv'][1], len(s3_client.objects['SBER_final.csv']))
+
+        asyncio.run(etl.process_bucket('mldata', force=True))
+        self.assertEqual(len(s3_client.downloads), 1 + 3)
+
+    def test_column_names_are_sanitized_once_per_header(self):
+        data = read_astr()
+        header = next(csv.reader(io.StringIO(data.decode())))
+        pg_client = PostgresStandIn({'securities': ['secid', 'date']})
+        s3_client = S3StandIn({f'{ticker}_final.csv': data for ticker in ('ASTR', 'SBER')})
+        etl = S3ToPostgresETL(s3_client, pg_client, 'securities', need_spec_check=False, load_mode='insert')
+        get_column_plan.cache_clear()
+        with patch.object(S3ToPostgresETLv2, 'sanitize_column_name',
+                          wraps=S3ToPostgresETLv2.sanitize_column_name) as sanitize:
+            asyncio.run(etl.process_bucket('mldata'))
+        self.assertEqual(sanitize.call_count, len(header))
+        self.assertEqual(len(pg_client.inserted), 2 * 383)
+        plan = get_column_plan(tuple(header), False)
+        self.assertEqual(plan.columns[plan.date_index], 'date')
+        self.assertEqual(plan.columns[header.index('Williams_%R')], 'williams_r')
+
+    def test_manifest_is_opt_in(self):
+        pg_client = self.load('copy')
+        self.assertFalse(any('_load_manifest' in query for query in pg_client.queries))
+        self.assertEqual(pg_client.manifest, {})
+
+    def test_unknown_load_mode(self):
+        with self.assertRaises(ValueError):
+            S3ToPostgresETL(S3StandIn({}), PostgresStandIn(), 'securities', load_mode='bulk')